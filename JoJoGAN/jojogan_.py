@@ -6,6 +6,8 @@ from PIL import Image
 import math
 import random
 import os
+import json
+import shutil
 
 import numpy as np
 from torch import nn, autograd, optim
@@ -148,6 +150,65 @@ def return_ID_loss():
 
 ###########################################################################
 
+TRANSFERS_NAME = "_transfers.json" # style_transferred_images 폴더마다 {결과 파일 이름: 만들 때의 설정} ("_"로 시작하여 FaceSwapper가 건너뜁니다)
+
+def transfer_settings(real_name:str, hyper_param:tuple) -> dict:
+  """ 변환 결과를 결정하는 설정 (실제 인물, (num_iter, alpha, loss_multiplier)) """
+  return {"real_name": real_name, "hyper_param": list(hyper_param)}
+
+def load_transfer_records(output_direc:str) -> dict:
+  try:
+    with open(os.path.join(output_direc, TRANSFERS_NAME), "r", encoding="utf-8") as f:
+      return json.load(f)
+  except (FileNotFoundError, json.JSONDecodeError):
+    return {}
+
+def record_transfers(output_direc:str, output_names:list, settings:dict) -> None:
+  """ 결과 파일들이 어떤 설정으로 만들어졌는지 기록합니다 (임시 파일에 쓴 뒤 교체) """
+  records = load_transfer_records(output_direc)
+  records.update({name: settings for name in output_names})
+  tmp_path = os.path.join(output_direc, f"{TRANSFERS_NAME}.tmp")
+  with open(tmp_path, "w", encoding="utf-8") as f:
+    json.dump(records, f, indent=4, ensure_ascii=False)
+  os.replace(tmp_path, os.path.join(output_direc, TRANSFERS_NAME))
+
+def load_face_groups(groups_path:str, cropped_faces_list:list, result_direc:str, settings:dict) -> tuple:
+  """
+  ({대표 크롭: 묶음의 크롭 리스트}, {앞 에피소드의 변환 결과 경로: 그 결과를 복사할 크롭 리스트})
+  묶음 파일이 없거나 묶음에 없는 크롭은 혼자인 묶음이 됩니다.
+  대표가 앞 에피소드의 크롭이면(dedup_scope="series") 그 에피소드의 변환 결과가 있고 같은 설정(settings : 실제 인물, 하이퍼파라미터)으로
+  만들어졌을 때만 재사용합니다. 아니면 이 에피소드의 첫 크롭을 대표로 다시 변환합니다.
+  """
+  groups, reused = {}, {}
+  prior_records = {}
+  if os.path.exists(groups_path):
+    with open(groups_path, "r", encoding="utf-8") as f:
+      for group in json.load(f)["groups"]:
+        members = [m for m in group["members"] if m in cropped_faces_list]
+        if not members:
+          continue
+        episode = group.get("episode")
+        if episode is not None:
+          prior_direc = os.path.join(result_direc, str(episode), "style_transferred_images")
+          if prior_direc not in prior_records:
+            prior_records[prior_direc] = load_transfer_records(prior_direc)
+          prior_name = f"{group['representative'].split('.')[0]}.st.png"
+          prior_output = os.path.join(prior_direc, prior_name)
+          if os.path.exists(prior_output) and prior_records[prior_direc].get(prior_name) == settings:
+            reused[prior_output] = members
+          else:
+            groups[members[0]] = members
+        elif group["representative"] in cropped_faces_list:
+          groups[group["representative"]] = members
+
+  grouped = {m for members in list(groups.values()) + list(reused.values()) for m in members}
+  for name in cropped_faces_list:
+    if name not in grouped:
+      groups[name] = [name]
+  return groups, reused
+
+###########################################################################
+
 def from_toon_2_real(project_direc:str, episode_num:int, hyper_param:tuple, real_name:str):
   num_iter, alpha, loss_multiplier = hyper_param
 
@@ -168,6 +229,15 @@ def from_toon_2_real(project_direc:str, episode_num:int, hyper_param:tuple, real
   os.makedirs(result_episode_style_transferred_images, exist_ok=True)
   
   cropped_faces_list = [i for i in os.listdir(result_episode_cropped_face_direc) if i != ".DS_Store" and i != ".ipynb_checkpoints"]
+  # 거의 같은 얼굴 묶음(scripts/dedup.py의 face_groups.json)이 있으면 묶음마다 대표 크롭만 변환하고 결과를 나머지에 복사합니다
+  # 대표가 앞 에피소드의 크롭이면 같은 실제 인물, 같은 하이퍼파라미터로 만든 그 에피소드의 변환 결과만 그대로 복사합니다
+  settings = transfer_settings(real_name, hyper_param)
+  face_groups, reused_outputs = load_face_groups(os.path.join(result_episode_direc, "face_groups.json"), cropped_faces_list, result_direc, settings)
+  for prior_output, members in reused_outputs.items():
+    member_names = [f"{member.split('.')[0]}.st.png" for member in members]
+    for member_name in member_names:
+      shutil.copyfile(prior_output, os.path.join(result_episode_style_transferred_images, member_name))
+    record_transfers(result_episode_style_transferred_images, member_names, settings)
 
 
   # 진짜 사람 얼굴 가져와서 process 하기
@@ -188,7 +258,7 @@ def from_toon_2_real(project_direc:str, episode_num:int, hyper_param:tuple, real
   generator = deepcopy(original_generator)
 
 
-  for cropped_face_file_name in cropped_faces_list:
+  for cropped_face_file_name, members in face_groups.items():
 
     cropped_face_path = os.path.join(result_episode_cropped_face_direc, cropped_face_file_name)
     targets, target_im, latents = get_target_im(cropped_face_path)
@@ -255,3 +325,10 @@ def from_toon_2_real(project_direc:str, episode_num:int, hyper_param:tuple, real
 
     save_image(my_output, output_path)
 
+    member_names = [f"{member.split('.')[0]}.st.png" for member in members]
+    for member_name in member_names:
+      if member_name == new_name:
+        continue
+      shutil.copyfile(output_path, os.path.join(result_episode_style_transferred_images, member_name))
+    record_transfers(result_episode_style_transferred_images, member_names, settings)
+
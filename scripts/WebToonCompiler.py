@@ -2,20 +2,88 @@ from PIL import Image
 from tqdm.notebook import tqdm
 import os
 import shutil
-import requests
-import json
+import time
+import hashlib
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 
 
 from bs4 import BeautifulSoup as bs
-import requests
-import os
+
+from downloader import EpisodeDownloader
+from manifest import CrawlState, EpisodeManifest, file_sha1
+from facepp import FaceDetector, FacePlusPlusClient
+from label_store import LabelStore
+from local_landmarks import LocalLandmarkDetector
+from panel_store import PanelSource, PanelStore
 
 
 Image.MAX_IMAGE_PIXELS = None
 
+ROW_CHUNK = 4096 # monotone_rows가 한 번에 비교하는 행 수 (bool 임시 배열 크기를 제한합니다)
+
+def monotone_rows(gray_img) -> np.ndarray:
+    """
+    흑백(L) 이미지의 각 행이 0 또는 255로만 이루어져 있는지를 (height,) bool 배열로 반환합니다
+    """
+    gray = np.asarray(gray_img, dtype=np.uint8)
+    if gray.ndim != 2:
+        raise ValueError(f"Expected a 2D grayscale array, got shape {gray.shape}")
+
+    is_monotone = np.empty(gray.shape[0], dtype=bool)
+    for top in range(0, gray.shape[0], ROW_CHUNK):
+        chunk = gray[top:top + ROW_CHUNK]
+        is_monotone[top:top + ROW_CHUNK] = ((chunk == 0) | (chunk == 255)).all(axis=1)
+
+    return is_monotone
+
+def rows_to_cuts(is_monotone : np.ndarray) -> list:
+    """
+    monotone_rows의 결과를 기존 dissect_image 루프와 동일한 (start_y, end_y) cuts 리스트로 변환합니다
+    """
+    total_height = len(is_monotone)
+    if total_height < 2: # 기존 루프는 높이가 1 이하이면 아무 컷도 만들지 않습니다
+        return []
+
+    # 상태가 바뀌는 행 (가장 아랫 행은 기존 루프와 같이 경계로 보지 않습니다)
+    changes = np.flatnonzero(is_monotone[1:-1] != is_monotone[:-2]) + 1
+
+    starts = [0] + changes.tolist()
+    ends = (changes - 1).tolist() + [total_height - 1]
+
+    return list(zip(starts, ends))
+
+BLANK_STD = 2 # 픽셀값 표준편차가 이보다 작으면 빈칸으로 봅니다
+
+def is_blank_array(panel : np.ndarray, threshold : float = BLANK_STD) -> bool:
+    """
+    컷 배열 전체 픽셀값(모든 채널)의 표준편차가 threshold 미만인지 판별합니다.
+    큰 컷에서도 float 임시 배열을 만들지 않도록 행 묶음 단위로 정수 합과 제곱합을 누적합니다.
+    """
+    panel = np.asarray(panel)
+    if panel.size == 0:
+        return False
+
+    rows = panel.reshape(panel.shape[0], -1)
+    total = 0
+    total_sq = 0
+    for top in range(0, rows.shape[0], ROW_CHUNK):
+        chunk = rows[top:top + ROW_CHUNK].astype(np.int64)
+        total += int(chunk.sum())
+        total_sq += int((chunk * chunk).sum())
+
+    # std < threshold  <=>  n * sum(x^2) - sum(x)^2 < threshold^2 * n^2 (정수 연산이므로 오차가 없습니다)
+    n = panel.size
+    return n * total_sq - total * total < (threshold ** 2) * n * n
+
 class DataJoonbiJoonbi():
-    def __init__(self, title : str, api_key : str, api_secret : str, project_direc : str, skip_download : bool, skip_preprocess : bool):
+    BASE_URL = "https://m.comic.naver.com" # 로컬 테스트 서버로 바꿔 끼울 수 있도록 분리합니다
+
+    def __init__(self, title : str, api_key : str, api_secret : str, project_direc : str, skip_download : bool, skip_preprocess : bool,
+                 streaming : bool = True, download_workers : int = 8, incremental : bool = True,
+                 workers : int = None, label_workers : int = 2, label_qps : float = 1.0, label_in_flight : int = 4,
+                 detector : str = "facepp", landmark_model_path : str = None, landmark_workers : int = None,
+                 export_png : bool = False):
 
         self.project_driec = project_direc
         self.dataset_direc = os.path.join(self.project_driec, "dataset")
@@ -25,7 +93,32 @@ class DataJoonbiJoonbi():
 
         self.api_key = api_key
         self.api_secret = api_secret
-        self.api_url = "https://api-us.faceplusplus.com/facepp/v3/detect"
+        self.api_url = FacePlusPlusClient.API_URL
+        self.label_cache_direc = os.path.join(self.project_driec, "cache", "facepp") # 컷 내용(sha1)별 Face++ 응답
+
+        self.download_workers = download_workers # 다운로드 스레드 수
+        self.incremental = incremental # True면 crawl_state.json을 보고 새로 나온 회차만 받습니다
+        self.streaming = streaming # True면 전체 스트립을 만들지 않고 조각 이미지를 순서대로 읽으며 컷을 나눕니다
+        self.workers = workers # 전처리 프로세스 수 (None이면 CPU 코어 수)
+        self.export_png = export_png # True면 패널 인덱스와 함께 img 폴더에 컷 PNG도 저장합니다 (확인용)
+        self.label_workers = label_workers # 동시에 라벨을 요청하는 에피소드 수
+        self.label_qps = label_qps # Face++ 요금제의 초당 요청 수
+        self.label_in_flight = label_in_flight # 동시에 보내는 Face++ 요청 수
+
+        # 라벨 생성 백엔드: "facepp" (Face++ API) 또는 "local" (dlib, 네트워크 없이 CPU에서 계산)
+        if detector not in ("facepp", "local"):
+            raise ValueError(f"Unknown detector: {detector} (expected 'facepp' or 'local')")
+        self.detector = detector
+        self.landmark_model_path = landmark_model_path or os.path.join(
+            self.project_driec, "JoJoGAN", "models", "dlibshape_predictor_68_face_landmarks.dat")
+        # 로컬 검출기의 프로세스 풀은 전처리 프로세스 풀과 동시에 돌아가므로, 지정하지 않은 쪽은 CPU 코어를 나눠 씁니다
+        self.landmark_workers = landmark_workers
+        if detector == "local":
+            cpu_count = os.cpu_count() or 1
+            if self.landmark_workers is None:
+                self.landmark_workers = max(1, cpu_count // 2 if workers is None else cpu_count - workers)
+            if self.workers is None:
+                self.workers = max(1, cpu_count - self.landmark_workers)
 
         if not skip_download:
             self.download_image()
@@ -41,13 +134,13 @@ class DataJoonbiJoonbi():
     def get_proprocessed_direc(self, episode_num : int) -> tuple:
 
         """ 
-        특정 에피소드의 전처리된 디렉토리를 (이미지_디렉토리, json_토리) 형태의 튜플로 반환합니다
+        특정 에피소드의 전처리된 경로를 (이미지_디렉토리, 라벨 파일(labels.jsonl)) 형태의 튜플로 반환합니다
         """
         
         episode_img_direc = os.path.join(self.dataset_direc, episode_num, "img")
-        episode_json_direc = os.path.join(self.dataset_direc, episode_num, "label")
+        episode_label_path = os.path.join(self.dataset_direc, episode_num, LabelStore.FILE_NAME)
 
-        return (episode_img_direc, episode_json_direc)
+        return (episode_img_direc, episode_label_path)
 
     def download_image(self) -> None:
         """ 
@@ -62,10 +155,27 @@ class DataJoonbiJoonbi():
         if not os.path.isdir(self.rawdata_direc):
             os.mkdir(self.rawdata_direc)
 
+        state = CrawlState(self.project_driec, title) if self.incremental else None
+
+        with EpisodeDownloader(headers, max_workers=self.download_workers) as downloader:
+            if state is not None and state.last_data_no is not None:
+                episodes = self.collect_new_episodes(downloader, title, state)
+            else:
+                episodes = self.collect_episodes(downloader, title, state)
+            failed = downloader.download_episodes(episodes, self.rawdata_direc, self.parse_image_urls)
+
+        if state is not None:
+            state.advance(episodes, failed)
+            state.save()
+
+    def find_episode_list(self, downloader : EpisodeDownloader, title : str) -> tuple:
+        """ 
+        검색 결과와 첫 리스트 페이지를 읽어 (페이지 번호를 뺀 리스트 주소, 전체 페이지 수)를 반환합니다
+        """
 
         # 네이버 웹툰 검색창에서 검색결과 긁어오기
-        search_url = "https://m.comic.naver.com/search/result?keyword=" + title.replace(" ", "%20")
-        search_page = requests.get(search_url, headers=headers) # headers 파라미터에 User-Agent 딕셔너리를 패스하고, url을 전달하여 내용물을 가져옵니다.
+        search_url = f"{self.BASE_URL}/search/result?keyword=" + title.replace(" ", "%20")
+        search_page = downloader.get(search_url) # 세션에 User-Agent 헤더가 들어있으므로 url만 전달하여 내용물을 가져옵니다.
 
         # 200이 나와야 정상적으로 서버와의 소통이 완료된 것입니다!
         print(f"Status : {search_page.status_code}")
@@ -91,7 +201,7 @@ class DataJoonbiJoonbi():
 
         # 에피소드 리스트의 url 회수
         toon_lists_url = (search_page.find_all("div", attrs={"class" : "lst"}))[0].find("a").get("href") # find_all()로 찾은 <a> tag attribute 중 href의 정보를 회수합니다.
-        toon_lists_url = "https://m.comic.naver.com/" + toon_lists_url
+        toon_lists_url = f"{self.BASE_URL}/" + toon_lists_url
         toon["toon_lists_url"] = toon_lists_url
 
         # 네이버 웹툰 상에 등록되어있는 웹툰의 아이디 회수
@@ -103,69 +213,129 @@ class DataJoonbiJoonbi():
         #     print(f"WebTon {attr} : {info}")
 
         # 에피소드 리스트가 나와있는 페이지의 html을 가져옵니다
-        toon_list = bs(requests.get(toon["toon_lists_url"], headers=headers).text, "html.parser")
+        toon_list = bs(downloader.get_text(toon["toon_lists_url"]), "html.parser")
 
         # 에피소드 리스트에 대한 정보 회수
 
         page_num= toon_list.find_all("div", attrs={"class" : "paging_type2"})[0] 
         curr_url_ = page_num.find_all("a", attrs = {"onclick" : "nclk_v2(event,'lst.next')"})[0].get("href")
-        curr_url_ = "https://m.comic.naver.com" + curr_url_[:-1] # -> 현재 리스트 페이지의 주소를 회수합니다. 가장 마지막 숫자가 페이지 수를 나타내므로 제거합니다.
+        curr_url_ = self.BASE_URL + curr_url_[:-1] # -> 현재 리스트 페이지의 주소를 회수합니다. 가장 마지막 숫자가 페이지 수를 나타내므로 제거합니다.
 
         page_num = page_num.find('em', class_='current_pg') 
         page_num = int(page_num.find('span', class_='total').string) # -> 가장 하단의 페이지 수 정보를 가져옵니다
 
         toon["page_num"] = page_num # 힘들게 얻어냈으니 잘 저장해줍니다.
 
-        for curr_page in range(page_num, 0, -1): # 앞서 얻은 페이지 수 정보와 리스트 주소 정보를 바탕으로 모든 페이지의 모든 에피소드를 긁어오겠습니다.
-            # 현재 리스트의 html을 가져옵니다
-            curr_url = f"{curr_url_}{curr_page}"
-            curr_list = bs(requests.get(curr_url, headers=headers).text, "html.parser")
-
-            # 개별 에피소드 정보에 접근합니다                           
-            episodes = curr_list.find_all("li", attrs= {"class" : "item", "data-no": not None, "data-free-convert-date": None})
-                                                                                            # 유료분 회차는 로그인이 필요하므로 회피합니다.
-            # 현재 리스트의 모든 에피소드에 대해 순회합니다
-            for episode in episodes:
-                # 개별 에피소드 주소 회수
-                episode_link = episode.find_all("a")[0].get('href')
-                episode_link = "https://m.comic.naver.com"+episode_link
-
-                # 개별 에피소드 제목 회수
-                episode_title = episode.find_all("span", attrs={"class" : "name"})[0]
-                episode_title = str(episode_title.contents[0])[8:-9]
-
-                # if "112" not in episode_title:
-                #     continue
+        return curr_url_, page_num
+
+    def collect_episodes(self, downloader : EpisodeDownloader, title : str, state : CrawlState = None) -> list:
+        """ 
+        모든 리스트 페이지를 읽어 [(에피소드 제목, 뷰어 페이지 url, data-no), ...]을 반환합니다
+        """
+        curr_url_, page_num = self.find_episode_list(downloader, title)
+        if state is not None:
+            state.list_url_prefix = curr_url_
+
+        # 리스트 페이지는 스레드 풀에서 동시에 가져오되, 순서는 기존과 같이 마지막 페이지부터 유지합니다
+        list_urls = [f"{curr_url_}{curr_page}" for curr_page in range(page_num, 0, -1)]
+        list_pages = downloader.executor.map(downloader.get_text, list_urls)
+
+        episode_list = []
+        for curr_list in list_pages: # 앞서 얻은 페이지 수 정보와 리스트 주소 정보를 바탕으로 모든 페이지의 모든 에피소드를 긁어오겠습니다.
+            episode_list.extend(self.parse_episode_list(curr_list))
+
+        return episode_list
+
+    def collect_new_episodes(self, downloader : EpisodeDownloader, title : str, state : CrawlState) -> list:
+        """
+        가장 최근 리스트 페이지(1페이지)부터 읽다가 이미 받은 회차(state.last_data_no 이하)를 만나면 멈춥니다.
+        리스트 페이지가 ETag / Last-Modified 기준으로 바뀌지 않았으면(304) 새 회차가 없는 것으로 봅니다.
+        """
+        if state.list_url_prefix is None:
+            state.list_url_prefix, _ = self.find_episode_list(downloader, title)
+
+        episode_list = []
+        seen = set()
+        curr_page = 1
+        while True:
+            curr_url = f"{state.list_url_prefix}{curr_page}"
+            response = downloader.get(curr_url, headers=state.conditional_headers(curr_url))
+            if response.status_code == 304:
+                break
+            response.raise_for_status()
+            state.remember_validators(curr_url, response)
+
+            # 마지막 페이지 판단은 유료 회차까지 포함한 전체 항목으로 합니다 (유료 회차만 있는 페이지에서 멈추지 않도록)
+            item_numbers, episodes = self.parse_list_page(response.text)
+            item_numbers = [data_no for data_no in item_numbers if data_no not in seen]
+            if not item_numbers: # 마지막 페이지를 지났습니다
+                break
+            seen.update(item_numbers)
+
+            page_numbers = set(item_numbers)
+            episode_list.extend(e for e in episodes if e[2] in page_numbers and e[2] > state.last_data_no)
+            if min(item_numbers) <= state.last_data_no: # 이미 받은 회차에 도달했습니다
+                break
+            curr_page += 1
+
+        print(f"{len(episode_list)} new episode(s) found in {curr_page} list page(s)")
+
+        return episode_list[::-1] # 기존과 같이 오래된 회차부터 받습니다
+
+    def parse_episode_list(self, curr_list : str) -> list:
+        """
+        리스트 페이지 html에서 무료 회차의 [(에피소드 제목, 뷰어 페이지 url, data-no), ...]을 추출합니다
+        """
+        return self.parse_list_page(curr_list)[1]
+
+    def parse_list_page(self, curr_list : str) -> tuple:
+        """
+        리스트 페이지 html에서 (유료 회차를 포함한 모든 항목의 data-no 리스트, 무료 회차 리스트)를 추출합니다
+        """
+        curr_list = bs(curr_list, "html.parser")
+        item_numbers = [int(item["data-no"]) for item in curr_list.find_all("li", attrs={"class" : "item", "data-no": True})]
+
+        # 개별 에피소드 정보에 접근합니다                           
+        episodes = curr_list.find_all("li", attrs= {"class" : "item", "data-no": not None, "data-free-convert-date": None})
+                                                                                        # 유료분 회차는 로그인이 필요하므로 회피합니다.
+        episode_list = []
+        # 현재 리스트의 모든 에피소드에 대해 순회합니다
+        for episode in episodes:
+            # 개별 에피소드 주소 회수
+            episode_link = episode.find_all("a")[0].get('href')
+            episode_link = self.BASE_URL+episode_link
+
+            # 개별 에피소드 제목 회수
+            episode_title = episode.find_all("span", attrs={"class" : "name"})[0]
+            episode_title = str(episode_title.contents[0])[8:-9]
+
+            # if "112" not in episode_title:
+            #     continue
 
-                # 개별 에피소드의 html을 가져옵니다
-                viewing_page = bs( requests.get(episode_link, headers=headers).text, "html.parser" )
+            episode_list.append((episode_title, episode_link, int(episode["data-no"])))
 
-                # 개별 에피소드의 모든 이미지 태그를 가져옵니다
-                images = viewing_page.find_all("div", attrs={"class" : "toon_view_lst", "id" : "toonLayer"})[0]
-                images = images.find_all("img")
+        return item_numbers, episode_list
 
-                # 앞서 회수한 모든 이미지 태그에서 이미지 url을 추출합니다
-                image_urls ={} # 여기에 모든 이미지 url을 저장합니다
-                for idx, image in enumerate(images):
-                    try: # 간혹 잘못된 이미지 태그가 긁혀오는 경우가 있어 예외처리를 진행해줍니다
-                        image_urls[idx] = image["data-src"]
-                        
-                    except KeyError as e:
-                        pass
+    def parse_image_urls(self, viewing_page : str) -> dict:
+        """
+        에피소드 뷰어 페이지 html에서 {순번: 이미지 url}을 추출합니다
+        """
+        viewing_page = bs(viewing_page, "html.parser")
 
-                # 에피소드 제목을 이름으로한 디렉토리를 만들어줍니다
-                episode_direc = os.path.join(self.rawdata_direc, episode_title)
+        # 개별 에피소드의 모든 이미지 태그를 가져옵니다
+        images = viewing_page.find_all("div", attrs={"class" : "toon_view_lst", "id" : "toonLayer"})[0]
+        images = images.find_all("img")
 
-                if not os.path.isdir(episode_direc):
-                    os.mkdir(episode_direc)
+        # 앞서 회수한 모든 이미지 태그에서 이미지 url을 추출합니다
+        image_urls ={} # 여기에 모든 이미지 url을 저장합니다
+        for idx, image in enumerate(images):
+            try: # 간혹 잘못된 이미지 태그가 긁혀오는 경우가 있어 예외처리를 진행해줍니다
+                image_urls[idx] = image["data-src"]
+                
+            except KeyError as e:
+                pass
 
-                # 각 에피소드의 모든 이미지를 다운로드하여, 지정된 경로에 저장합니다
-                for idx, url in image_urls.items():
-                    img = requests.get(url, headers=headers).content
-                    img_path = os.path.join(episode_direc, f"{idx}.jpg")
-                    with open(img_path, 'wb') as f:
-                        f.write(img)
-                print(f"Episode {episode_title} is saved!")
+        return image_urls
 
     def ThisWillDoTheJob(self) -> None:
 
@@ -175,87 +345,197 @@ class DataJoonbiJoonbi():
         ep_list = [d for d in os.listdir(self.rawdata_direc) if os.path.isdir(os.path.join(self.rawdata_direc, d))]
         ep_num_list = [ i.split()[0][:-1] for i in ep_list]
 
-        for episode_num, epidose_direc in tqdm(zip(ep_num_list, ep_list), total=len(ep_num_list)):
-            # if episode_num != "112" :
-            #     continue
-            dataset_ep_direc = os.path.join(self.dataset_direc, episode_num)
-            split_img_direc = os.path.join(dataset_ep_direc, "img")
-            json_label_direc = os.path.join(dataset_ep_direc, "label")
+        # 이미지 작업(컷 나누기, 빈칸 판별)은 에피소드 단위로 프로세스 풀에 나눠주고,
+        # 네트워크 작업(라벨 요청)은 별도의 스레드 풀에서 label_workers 개만 동시에 진행합니다
+        with ProcessPoolExecutor(max_workers=self.workers) as image_pool, \
+             ThreadPoolExecutor(max_workers=self.label_workers) as label_pool, \
+             self.make_detector() as detector:
 
-            if not os.path.isdir(dataset_ep_direc):
-                os.mkdir(dataset_ep_direc)
-            if not os.path.isdir(split_img_direc):
-                os.mkdir(split_img_direc)
+            image_futures = {}
+            for episode_num, epidose_direc in zip(ep_num_list, ep_list):
+                # if episode_num != "112" :
+                #     continue
+                dataset_ep_direc = os.path.join(self.dataset_direc, episode_num)
+
+                os.makedirs(dataset_ep_direc, exist_ok=True)
+                if self.export_png:
+                    os.makedirs(os.path.join(dataset_ep_direc, "img"), exist_ok=True)
+
+                img_files_direc = os.path.join(self.rawdata_direc, epidose_direc)
+                future = image_pool.submit(self.preprocess_episode, img_files_direc, dataset_ep_direc)
+                image_futures[future] = (episode_num, dataset_ep_direc)
+
+            label_futures = {}
+            worker_done = {} # 워커(pid)별 완료한 에피소드 수
+            progress = tqdm(total=len(image_futures))
+
+            for future in as_completed(image_futures):
+                episode_num, dataset_ep_direc = image_futures[future]
+                progress.update()
+                try:
+                    worker, elapsed, panel_files, skipped = future.result()
+                except Exception as e:
+                    progress.write(f"Preprocessing episode_{episode_num} failed ({e})")
+                    continue
 
-            img_files_direc = os.path.join(self.rawdata_direc, epidose_direc)
-            compiled_img = self.compile_images(img_files_direc)
-            self.dissect_image(compiled_img, split_img_direc)
-            # print(split_img_direc)
+                worker_done[worker] = worker_done.get(worker, 0) + 1
+                progress.set_postfix({f"worker{pid}": n for pid, n in worker_done.items()})
+                status = "unchanged" if skipped else f"{elapsed:.1f}s"
+                progress.write(f"[worker {worker}] episode_{episode_num} : {len(panel_files)} panels ({status})")
 
-            if not os.path.isdir(json_label_direc):
-                os.mkdir(json_label_direc)
+                label_future = label_pool.submit(self.label_episode, dataset_ep_direc, detector)
+                label_futures[label_future] = episode_num
 
-            img_list = os.listdir(split_img_direc)
+            progress.close()
 
-            for img_file_name in img_list:
+            for future in as_completed(label_futures):
+                episode_num = label_futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Generating labels for episode_{episode_num} failed ({e})")
+                    continue
+                print(f"Generating labels for episode_{episode_num} is completed!")
 
-                image_path = os.path.join(split_img_direc, img_file_name)
-                img = open(image_path, 'rb')
+    def preprocess_episode(self, img_files_direc : str, dataset_ep_direc : str) -> tuple:
+        """
+        (워커 프로세스에서 실행) 한 에피소드의 컷을 나누고 빈칸 여부를 manifest에 기록합니다 (빈칸은 저장하지 않습니다).
+        조각 이미지의 해시가 manifest와 같으면 컷 나누기를 건너뜁니다.
+        (워커 pid, 소요 시간, 빈칸이 아닌 컷 파일 이름 리스트, 건너뛰었는지 여부)를 반환합니다
+        """
+        start = time.perf_counter()
+        split_img_direc = os.path.join(dataset_ep_direc, "img") if self.export_png else None
 
-                if self.is_it_blank(img_path=image_path): # 저희 데이터셋에 빈칸인 컷 많습니다. 얘네까지 api 요청하고 앉아있으니 시간이 너무 오래걸려서 추가합니다.
-                    
-                    continue
-                
-                json_path = os.path.join(json_label_direc, f"{img_file_name[:-4]}.js")
-                self.get_json(img, json_path)
-                    
+        manifest = EpisodeManifest(dataset_ep_direc)
+        store = PanelStore(dataset_ep_direc)
+        inputs = {os.path.basename(path): file_sha1(path) for path in self.sorted_slices(img_files_direc)}
 
-            print(f"Generating labels for episode_{episode_num} is completed!")
+        if manifest.is_dissected(inputs, store, split_img_direc):
+            return os.getpid(), time.perf_counter() - start, manifest.content_panels(), True
 
-    def get_json(self, img : Image, json_path : str) -> None:
+        # 이전 결과의 컷 수가 달라질 수 있으므로 예전에 저장한 컷 PNG는 먼저 지웁니다
+        old_img_direc = os.path.join(dataset_ep_direc, "img")
+        for panel in manifest.panels:
+            panel_path = os.path.join(old_img_direc, panel)
+            if os.path.isfile(panel_path):
+                os.remove(panel_path)
 
-        files = {'image_file': img}
-        data = {
-                'api_key': self.api_key,
-                'api_secret': self.api_secret,
-                'return_landmark': '1',
-                'return_attributes': 'gender,age,smiling,headpose,facequality,blur,eyestatus,emotion'
-                }
+        if self.streaming:
+            panels = self.stream_dissect(img_files_direc, store, split_img_direc)
+        else:
+            compiled_img = self.compile_images(img_files_direc)
+            panels = self.dissect_image(compiled_img, store, split_img_direc)
 
-        response = requests.post(self.api_url, files=files, data=data)
+        manifest.inputs = inputs
+        manifest.panels = panels
+        manifest.save()
 
-        try:
-            json_label = response.json()
-        except json.JSONDecodeError:
-            print("Failed to decode JSON. Response content:", response.text)
-            return
+        return os.getpid(), time.perf_counter() - start, manifest.content_panels(), False
+
+    def make_detector(self) -> FaceDetector:
+        """
+        라벨 생성에 쓸 얼굴 검출기를 만듭니다 (with 문으로 닫아주세요)
+        """
+        if self.detector == "local":
+            return LocalLandmarkDetector(self.landmark_model_path, workers=self.landmark_workers)
 
-        with open(json_path, 'w') as file:
-            json.dump(json_label, file, indent=4)
+        return FacePlusPlusClient(self.api_key, self.api_secret, cache_direc=self.label_cache_direc, api_url=self.api_url,
+                                  qps=self.label_qps, max_in_flight=self.label_in_flight)
+
+    def label_episode(self, dataset_ep_direc : str, detector : FaceDetector) -> None:
+        """
+        (라벨 스레드에서 실행) 빈칸이 아닌 컷마다 얼굴 라벨을 요청하여 dataset/<에피소드>/labels.jsonl 에 덧붙입니다.
+        컷 내용이 바뀌지 않았고 같은 백엔드의 라벨이 있으면 다시 요청하지 않습니다.
+        """
+        manifest = EpisodeManifest(dataset_ep_direc)
+        source = PanelSource(dataset_ep_direc)
+        labels = LabelStore(dataset_ep_direc) # 예전 label/*.js 파일이 있으면 처음 한 번 옮겨옵니다
+        if manifest.legacy_labels:
+            manifest.legacy_labels = {}
+            manifest.save()
+        manifest.prune_labels(labels)
+        errors = labels.errors()
+
+        # 요청은 detector의 스레드 풀에서 동시에 진행되고, 결과는 도착하는 순서대로 한 줄씩 덧붙입니다
+        # (중간에 멈춰도 받은 라벨은 다시 요청하지 않습니다)
+        futures = {}
+        for img_file_name in manifest.content_panels():
+            if manifest.label_is_fresh(img_file_name, labels, self.detector):
+                continue
+            futures[detector.submit_array(source.load(img_file_name))] = img_file_name
+
+        for future in as_completed(futures):
+            img_file_name = futures[future]
+            try:
+                json_label = future.result()
+            except Exception as e: # 한 컷의 실패로 에피소드 전체 라벨링을 멈추지 않습니다 (다음 실행에서 다시 요청됩니다)
+                print(f"Labelling {os.path.basename(dataset_ep_direc)}/{img_file_name} failed ({e})")
+                continue
+            if json_label is None:
+                continue
+            if "faces" not in json_label:
+                # 오류 응답은 라벨로 저장하지 않으므로 다음 실행에서 다시 요청됩니다 (Face++ 캐시에 있으면 할당량은 쓰지 않습니다)
+                print(f"Labelling {os.path.basename(dataset_ep_direc)}/{img_file_name} failed ({json_label.get('error_message', json_label)})")
+                errors.put({"panel": img_file_name, "sha1": manifest.panels[img_file_name]["sha1"], "detector": self.detector,
+                            "error": json_label})
+                continue
+            labels.add(img_file_name, manifest.panels[img_file_name]["sha1"], self.detector, json_label)
+
+        # 이제 라벨이 있는 컷의 예전 오류 기록은 지웁니다
+        errors.compact(keep={panel for panel in errors.keys() if not manifest.label_is_fresh(panel, labels, self.detector)})
 
     def is_it_blank(self, img_path : str) -> bool:
 
-        image = Image.open(img_path)
-        # Get pixel data
-        pixel_data = list(image.getdata())
-        
-        pixel_data = np.array(pixel_data)
+        with Image.open(img_path) as image:
+            return is_blank_array(np.asarray(image))
 
-        is_blank = (np.std(pixel_data) < 2)
-        
-        return is_blank
+    def save_panels(self, panels, store : PanelStore, output_folder : str = None) -> dict:
+        """
+        (컷 번호, 시작 y, RGB 배열)을 받아 패널 인덱스(store)에 기록하고
+        {컷 이름: {"sha1": 픽셀 해시, "blank": 빈칸 여부}}를 반환합니다.
+        빈칸이 아닌 컷만 픽셀을 저장하며, output_folder를 주면 PNG 파일로도 저장합니다.
+        빈칸 판별은 메모리에 있는 배열로 하므로 저장한 파일을 다시 열지 않습니다.
+        """
+        records = {}
+        store.create()
+        for panel_idx, top, panel in panels:
+            if panel.shape[0] == 0:
+                continue
+
+            file_name = f'{panel_idx}.png'
+            blank = is_blank_array(panel)
+            digest = hashlib.sha1(str(panel.shape).encode())
+            digest.update(np.ascontiguousarray(panel).data)
+            records[file_name] = {"sha1": digest.hexdigest(), "blank": blank}
+
+            # 저희 데이터셋에 빈칸인 컷 많습니다. 빈칸은 위치만 기록하고 픽셀 저장도, api 요청도 하지 않습니다.
+            store.append(file_name, top, panel, blank, records[file_name]["sha1"])
+            if not blank and output_folder is not None:
+                Image.fromarray(panel).save(os.path.join(output_folder, file_name))
+        store.finish()
+
+        return records
         
-    def compile_images(self, image_folder : str) -> Image :
+    def sorted_slices(self, image_folder : str) -> list:
+        """
+        에피소드 폴더의 조각 이미지 경로를 번호 순서대로 반환합니다
+        """
         # Get list of image files in the folder
-        image_files = [f for f in os.listdir(image_folder) if os.path.isfile(os.path.join(image_folder, f))]
+        image_files = [f for f in os.listdir(image_folder) if os.path.isfile(os.path.join(image_folder, f))
+                       and os.path.splitext(f)[0].isdigit()] # manifest.json, 받다 만 .part 파일 제외
         # if ".DS_Store" in image_files:
         #     image_files.remove(".DS_Store")
         
         # Sort image files to maintain order
         image_files = sorted(image_files, key=lambda x: int(os.path.splitext(x)[0]))
+
+        return [os.path.join(image_folder, f) for f in image_files]
+
+    def compile_images(self, image_folder : str) -> Image :
+        image_files = self.sorted_slices(image_folder)
         
         # Open images and get their sizes
-        images = [Image.open(os.path.join(image_folder, img)) for img in image_files]
+        images = [Image.open(img) for img in image_files]
         widths, heights = zip(*(img.size for img in images))
         
         # Calculate total height and max width
@@ -273,54 +553,95 @@ class DataJoonbiJoonbi():
         
         return compiled_image
 
-    def dissect_image(self, input_image: Image, output_folder: str) -> None:
+    def dissect_image(self, input_image: Image, store : PanelStore, output_folder: str = None) -> dict:
         # Open the compiled image
         img = input_image
         
         # Convert image to grayscale
         gray_img = img.convert('L')
-        total_height = gray_img.height
         
-        # Get pixel data
-        pixels = gray_img.load()
+        # 행 단위로 단색(0 또는 255) 여부를 한 번에 판별한 뒤, 구간 경계를 cuts로 변환합니다
+        cuts = rows_to_cuts(monotone_rows(gray_img))
         
-        # Initialize variables
-        cuts = []
-        start_y = 0
-        curr = None
+        def iter_cuts():
+            for i, (start_y, end_y) in enumerate(cuts):
+                top = 0 if i == 0 else cuts[i-1][1]
+                yield i+1, top, np.asarray(img.crop((0, top, img.width, end_y)).convert('RGB'))
+
+        return self.save_panels(iter_cuts(), store, output_folder)
+
+    def iter_panels(self, image_folder : str):
+        """
+        조각 이미지를 순서대로 읽으며 컷이 닫히는 즉시 (컷 번호, 시작 y, RGB 배열)을 내보냅니다.
+        compile_images + dissect_image와 같은 컷을 만들지만, 메모리에는 가장 큰 컷과 조각 하나만 남습니다.
+        """
+        slice_paths = self.sorted_slices(image_folder)
+
+        # 헤더만 읽어 전체 크기를 구합니다 (compile_images의 캔버스 크기와 동일)
+        sizes = []
+        for path in slice_paths:
+            with Image.open(path) as img:
+                sizes.append(img.size)
+        if not sizes:
+            return
+
+        max_width = max(w for w, _ in sizes)
+        total_height = sum(h for _, h in sizes)
+        if total_height < 2: # dissect_image와 동일하게 컷이 없습니다
+            return
+
+        buffer = []     # 아직 내보내지 않은 행들 (buffer_top부터 이어짐)
+        buffer_top = 0
+        panel_top = 0   # 다음 컷의 시작 행 (dissect_image처럼 이전 컷의 end_y부터 시작)
+        panel_idx = 0
         prev = None
-        
-        # Iterate over each row to find cuts
-        for y in range(total_height):
-            row_pixels = [pixels[x, y] for x in range(gray_img.width)]
-            is_pixel_monotone = all(p == 255 or p == 0 for p in row_pixels)
-            prev = curr
-            curr = is_pixel_monotone
+        y_offset = 0
 
-            if y == 0 : # 가장 윗 부분 누락 방지
-                start_y = y
+        def take_rows(start, end):
+            rows = buffer[0] if len(buffer) == 1 else np.concatenate(buffer)
+            return rows[start - buffer_top:end - buffer_top]
 
-            elif y == total_height-1: # 가장 아랫 부분 누락 방지
-                end_y = y
+        for path, (width, height) in zip(slice_paths, sizes):
+            with Image.open(path) as img:
+                rgb = img.convert('RGB')
 
-                cuts.append((start_y, end_y))
+            # compile_images의 paste와 같이 좁은 조각은 오른쪽을 검은색으로 채웁니다
+            rows = np.zeros((height, max_width, 3), dtype=np.uint8)
+            rows[:, :width] = np.asarray(rgb)
+            buffer.append(rows)
 
+            is_monotone = monotone_rows(rgb.convert('L')) # 검은색 여백은 단색이므로 결과에 영향이 없습니다
+
+            # 조각 경계를 넘어 이전 행과 비교하여 상태가 바뀌는 행을 찾습니다
+            if prev is None:
+                changes = np.flatnonzero(is_monotone[1:] != is_monotone[:-1]) + 1
             else:
-                if curr == prev: # 이전의 상황이 지속되는 상태
+                changes = np.flatnonzero(np.concatenate(([prev], is_monotone[:-1])) != is_monotone)
+            prev = is_monotone[-1]
+
+            for y in (changes + y_offset).tolist():
+                if y < 1 or y > total_height - 2: # 가장 아랫 행은 dissect_image와 같이 경계로 보지 않습니다
                     continue
-                else: # 내용이 있는 부분이 끝났거나 (False -> True), 같은 픽셀값으로 채워진 영역이 끝났거나 (True -> False)
-                    end_y = y-1
+                end_y = y - 1
+                panel_idx += 1
+                yield panel_idx, panel_top, take_rows(panel_top, end_y)
 
-                    cuts.append((start_y, end_y)) 
-                    start_y = y
-        
-        for i, (start_y, end_y) in enumerate(cuts):
-            if i == 0:
-                cut_img = img.crop((0, 0, img.width, end_y))
-            else:
-                cut_img = img.crop((0, cuts[i-1][1], img.width, end_y))
-            
-            cut_img.save(os.path.join(output_folder, f'{i+1}.png'))
+                # 다음 컷에 필요 없는 행은 버립니다
+                remaining = take_rows(end_y, y_offset + height)
+                buffer = [remaining]
+                buffer_top = end_y
+                panel_top = end_y
+
+            y_offset += height
+
+        panel_idx += 1
+        yield panel_idx, panel_top, take_rows(panel_top, total_height - 1)
+
+    def stream_dissect(self, image_folder : str, store : PanelStore, output_folder : str = None) -> dict:
+        """
+        전체 스트립을 만들지 않고 iter_panels로 컷을 나누어 dissect_image와 같은 컷으로 저장합니다
+        """
+        return self.save_panels(self.iter_panels(image_folder), store, output_folder)
 
     def delete_all_folders_in(self, directory : str) -> None:
         folder_list = os.listdir(directory)
@@ -0,0 +1,97 @@
+import argparse
+import time
+
+import numpy as np
+from PIL import Image
+
+from WebToonCompiler import monotone_rows, rows_to_cuts
+
+
+def make_synthetic_strip(width : int = 690, height : int = 20000, seed : int = 0) -> Image:
+    """
+    흰 여백(gutter)과 노이즈로 채운 컷이 번갈아 나오는 가짜 에피소드 스트립을 만듭니다
+    """
+    rng = np.random.default_rng(seed)
+    strip = np.full((height, width), 255, dtype=np.uint8)
+
+    y = 0
+    while y < height:
+        y += int(rng.integers(50, 400)) # 여백
+        panel_height = int(rng.integers(300, 1500))
+        strip[y:y + panel_height] = rng.integers(1, 255, size=(min(panel_height, max(height - y, 0)), width), dtype=np.uint8)
+        y += panel_height
+
+    return Image.fromarray(strip)
+
+
+def legacy_cuts(gray_img : Image) -> list:
+    """
+    기존 dissect_image의 픽셀 단위 파이썬 루프 (비교 기준)
+    """
+    total_height = gray_img.height
+    pixels = gray_img.load()
+
+    cuts = []
+    start_y = 0
+    curr = None
+    prev = None
+
+    for y in range(total_height):
+        row_pixels = [pixels[x, y] for x in range(gray_img.width)]
+        is_pixel_monotone = all(p == 255 or p == 0 for p in row_pixels)
+        prev = curr
+        curr = is_pixel_monotone
+
+        if y == 0:
+            start_y = y
+        elif y == total_height-1:
+            cuts.append((start_y, y))
+        else:
+            if curr == prev:
+                continue
+            cuts.append((start_y, y-1))
+            start_y = y
+
+    return cuts
+
+
+def bench_dissect(width : int = 690, height : int = 20000, repeat : int = 3, skip_legacy : bool = False) -> dict:
+    """
+    합성 스트립에서 기존 루프와 NumPy 행 분류기의 cuts 계산 시간을 비교합니다
+    """
+    gray_img = make_synthetic_strip(width, height)
+
+    vectorized_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cuts = rows_to_cuts(monotone_rows(gray_img))
+        vectorized_times.append(time.perf_counter() - start)
+
+    result = {"width": width, "height": height, "num_cuts": len(cuts), "vectorized_sec": min(vectorized_times)}
+
+    if not skip_legacy:
+        start = time.perf_counter()
+        expected = legacy_cuts(gray_img)
+        result["legacy_sec"] = time.perf_counter() - start
+        result["speedup"] = result["legacy_sec"] / max(result["vectorized_sec"], 1e-9)
+
+        if expected != cuts:
+            raise AssertionError("Vectorized cuts differ from the legacy loop")
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="dissect_image gutter detection benchmark")
+    parser.add_argument("--width", type=int, default=690)
+    parser.add_argument("--height", type=int, nargs="+", default=[2000, 20000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="기존 루프 측정 생략 (긴 스트립에서 수 분 소요)")
+    args = parser.parse_args()
+
+    for height in args.height:
+        result = bench_dissect(args.width, height, args.repeat, args.skip_legacy)
+        line = f"{result['width']}x{result['height']} | cuts {result['num_cuts']} | numpy {result['vectorized_sec']*1000:.1f} ms"
+        if "legacy_sec" in result:
+            line += f" | legacy {result['legacy_sec']:.2f} s | x{result['speedup']:.0f}"
+        print(line)
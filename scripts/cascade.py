@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from classifier import STUDENT_ARCHS, BatchClassifier, build_student, list_labeled, make_transform
+from manifest import load_json, write_json_atomic
+
+
+EMBEDDERS = STUDENT_ARCHS + ("clip",)
+
+
+class _ClipImageEncoder(nn.Module):
+    def __init__(self, clip_model):
+        super().__init__()
+        self.clip_model = clip_model
+
+    def forward(self, images):
+        return self.clip_model.encode_image(images)
+
+
+def build_embedder(kind : str = "mobilenet_v3_small", weights_path : str = None, device : str = "cpu") -> tuple:
+    """
+    값싼 임베딩 모델과 전처리를 반환합니다.
+    - torchvision 경량 모델 : 분류층을 뗀 특징 추출기 (weights_path가 있으면 distill.py의 학생 가중치, 없으면 ImageNet 가중치)
+    - "clip" : open_clip의 ViT-B-32 이미지 인코더 (README의 CLIP 필터)
+    """
+    if kind == "clip":
+        try:
+            import open_clip
+        except ImportError:
+            raise ImportError("open_clip이 필요합니다. 'pip install open_clip_torch' 명령어로 설치하세요.")
+        clip_model, _, transform = open_clip.create_model_and_transforms("ViT-B-32", pretrained="openai")
+        return _ClipImageEncoder(clip_model).to(device).eval(), transform
+
+    if kind not in STUDENT_ARCHS:
+        raise ValueError(f"embedder must be one of {EMBEDDERS}, got {kind}")
+    model = build_student(kind, num_classes=2, weights_path=weights_path, device=device, pretrained=weights_path is None)
+    if kind == "resnet18":
+        model.fc = nn.Identity()
+    else:
+        model.classifier[-1] = nn.Identity()
+    return model.eval(), make_transform(224)
+
+
+class Embedder(BatchClassifier):
+    """ 얼굴 크롭 -> L2 정규화된 임베딩 (BatchClassifier의 배치 추론 경로를 그대로 씁니다) """
+
+    def __init__(self, kind : str = "mobilenet_v3_small", weights_path : str = None, device : str = "cpu",
+                 batch_size : int = 32, num_workers : int = None):
+        model, transform = build_embedder(kind, weights_path, device)
+        super().__init__(model, transform, device, batch_size=batch_size, num_workers=num_workers)
+
+    def embed(self, paths : list) -> np.ndarray:
+        return self._run(paths, lambda features: F.normalize(features.float().flatten(1), dim=1))
+
+
+def head_probability(embeddings : np.ndarray, coef : np.ndarray, intercept : float) -> np.ndarray:
+    """ 로지스틱 회귀 헤드의 주인공 확률 """
+    return 1.0 / (1.0 + np.exp(-(embeddings @ coef + intercept)))
+
+
+def calibrate_thresholds(probs : np.ndarray, labels : np.ndarray, target_precision : float = 0.99) -> dict:
+    """
+    라벨된 표본의 (교차 검증) 헤드 확률로 두 임계값을 정합니다.
+    - positive : p >= positive 인 크롭 중 주인공 비율이 target_precision 이상이 되는 가장 낮은 값
+    - negative : p <= negative 인 크롭 중 주인공이 아닌 비율이 target_precision 이상이 되는 가장 높은 값
+    두 값 사이의 크롭만 VGG19로 넘깁니다. 같은 확률의 크롭은 함께 들어가거나 함께 빠집니다.
+    """
+    order = np.argsort(probs, kind="stable")
+    p_sorted, y_sorted = probs[order], labels[order]
+    n = len(probs)
+    counts = np.arange(1, n + 1)
+    # 확률이 바뀌는 지점에서만 자를 수 있습니다
+    cuttable_low = np.append(p_sorted[:-1] < p_sorted[1:], True)
+    cuttable_high = np.append(p_sorted[::-1][:-1] > p_sorted[::-1][1:], True)
+
+    # 낮은 쪽부터 k개를 음성으로 판정할 때의 정밀도
+    negative_precision = np.cumsum(1 - y_sorted) / counts
+    valid_low = np.nonzero((negative_precision >= target_precision) & cuttable_low)[0]
+    negative = float(p_sorted[valid_low[-1]]) if len(valid_low) else -1.0
+
+    # 높은 쪽부터 k개를 양성으로 판정할 때의 정밀도
+    positive_precision = np.cumsum(y_sorted[::-1]) / counts
+    valid_high = np.nonzero((positive_precision >= target_precision) & cuttable_high)[0]
+    positive = float(p_sorted[::-1][valid_high[-1]]) if len(valid_high) else 2.0
+
+    return {"negative": negative, "positive": positive}
+
+
+def cascade_decisions(probs : np.ndarray, thresholds : dict) -> np.ndarray:
+    """ 1 : 확실한 주인공, 0 : 확실히 아님, -1 : VGG19로 넘김 (두 조건이 겹치면 주인공이 우선합니다) """
+    decisions = np.full(len(probs), -1, dtype=np.int64)
+    decisions[probs <= thresholds["negative"]] = 0
+    decisions[probs >= thresholds["positive"]] = 1
+    return decisions
+
+
+def fit_cascade(labeled_direc : str, output_path : str, embedder : str = "mobilenet_v3_small", embedder_weights : str = None,
+                target_precision : float = 0.99, folds : int = 5, device : str = None, batch_size : int = 32) -> dict:
+    """
+    <labeled_direc>/<클래스 번호>/*.png 표본으로 임베딩 + 로지스틱 회귀 헤드를 학습하고,
+    교차 검증 확률로 임계값을 보정하여 output_path(JSON)에 저장합니다. 표본에서의 단계별 통과율을 함께 기록합니다.
+    """
+    try:
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import StratifiedKFold, cross_val_predict
+    except ImportError:
+        raise ImportError("scikit-learn이 필요합니다. 'pip install scikit-learn' 명령어로 설치하세요.")
+
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    paths, labels = list_labeled(labeled_direc)
+    if set(labels.tolist()) - {0, 1}:
+        raise ValueError(f"Only class directories 0 and 1 are supported under {labeled_direc}, found {sorted(set(labels.tolist()))}")
+    # 교차 검증은 클래스마다 폴드 수 이상의 표본이 필요하므로, 폴드가 2개도 안 되는 경우를 임베딩 전에 막습니다
+    for label in (0, 1):
+        count = int((labels == label).sum())
+        if count < 2:
+            raise ValueError(f"Need at least 2 labelled crops in {os.path.join(labeled_direc, str(label))}, found {count}")
+
+    embeddings = Embedder(embedder, embedder_weights, device, batch_size=batch_size).embed(paths)
+    head = LogisticRegression(max_iter=2000, class_weight="balanced")
+    folds = min(folds, int(np.bincount(labels).min()))
+    oof_probs = cross_val_predict(head, embeddings, labels, method="predict_proba",
+                                  cv=StratifiedKFold(folds, shuffle=True, random_state=0))[:, 1]
+    thresholds = calibrate_thresholds(oof_probs, labels, target_precision)
+    head.fit(embeddings, labels)
+
+    decisions = cascade_decisions(oof_probs, thresholds)
+    confident = decisions >= 0
+    calibration = {
+        "samples": len(paths),
+        "positive_rate": float((decisions == 1).mean()),
+        "negative_rate": float((decisions == 0).mean()),
+        "escalation_rate": float((decisions == -1).mean()),
+        "confident_accuracy": float((decisions[confident] == labels[confident]).mean()) if confident.any() else None,
+    }
+
+    config = {
+        "embedder": embedder,
+        "embedder_weights": embedder_weights,
+        "coef": head.coef_[0].tolist(),
+        "intercept": float(head.intercept_[0]),
+        "thresholds": thresholds,
+        "target_precision": target_precision,
+        "calibration": calibration,
+    }
+    write_json_atomic(output_path, config)
+    return config
+
+
+class CascadeClassifier():
+    """
+    2단계 분류기. 값싼 임베딩 + 선형 헤드가 확실한 크롭을 먼저 판정하고, 불확실한 크롭만 fallback(VGG19 BatchClassifier)으로 넘깁니다.
+    BatchClassifier와 같이 predict(paths) -> (N, 2) 확률과 stats를 제공합니다. stats에는 단계별 통과율이 남습니다.
+    """
+
+    def __init__(self, cascade_path : str, fallback : BatchClassifier, device : str = "cpu",
+                 batch_size : int = 32, num_workers : int = None):
+        config = load_json(cascade_path)
+        if config is None:
+            raise FileNotFoundError(f"Cascade config not found: {cascade_path}")
+        self.embedder = Embedder(config["embedder"], config.get("embedder_weights"), device,
+                                 batch_size=batch_size, num_workers=num_workers)
+        self.coef = np.asarray(config["coef"], dtype=np.float32)
+        self.intercept = config["intercept"]
+        self.thresholds = config["thresholds"]
+        self.fallback = fallback
+
+        self.stats = {"images": 0, "seconds": 0.0, "images_per_sec": None,
+                      "confident_positive": 0, "confident_negative": 0, "escalated": 0, "pass_rates": None}
+
+    def predict(self, paths : list) -> np.ndarray:
+        if not paths:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        start = time.perf_counter()
+        head_probs = head_probability(self.embedder.embed(paths), self.coef, self.intercept)
+        decisions = cascade_decisions(head_probs, self.thresholds)
+
+        probabilities = np.stack([1.0 - head_probs, head_probs], axis=1).astype(np.float32)
+        escalated = np.nonzero(decisions == -1)[0]
+        if len(escalated):
+            probabilities[escalated] = self.fallback.predict([paths[i] for i in escalated])
+        elapsed = time.perf_counter() - start
+
+        self.stats["images"] += len(paths)
+        self.stats["seconds"] += elapsed
+        self.stats["images_per_sec"] = self.stats["images"] / self.stats["seconds"] if self.stats["seconds"] > 0 else None
+        self.stats["confident_positive"] += int((decisions == 1).sum())
+        self.stats["confident_negative"] += int((decisions == 0).sum())
+        self.stats["escalated"] += len(escalated)
+        self.stats["pass_rates"] = {
+            "stage1_decided": (self.stats["confident_positive"] + self.stats["confident_negative"]) / self.stats["images"],
+            "stage2_escalated": self.stats["escalated"] / self.stats["images"],
+        }
+        return probabilities
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="임베딩 + 선형 헤드 1단계 분류기 학습과 임계값 보정")
+    parser.add_argument("labeled", help="<폴더>/<클래스 번호>/*.png 형태의 라벨된 크롭")
+    parser.add_argument("--output", default="cascade.json")
+    parser.add_argument("--embedder", default="mobilenet_v3_small", choices=EMBEDDERS)
+    parser.add_argument("--embedder-weights", default=None, help="distill.py로 만든 학생 가중치 (없으면 ImageNet 가중치)")
+    parser.add_argument("--target-precision", type=float, default=0.99)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--device", default=None)
+    args = parser.parse_args()
+
+    config = fit_cascade(args.labeled, args.output, embedder=args.embedder, embedder_weights=args.embedder_weights,
+                         target_precision=args.target_precision, folds=args.folds, device=args.device)
+    print(json.dumps({"thresholds": config["thresholds"], "calibration": config["calibration"]}, indent=4))
@@ -0,0 +1,151 @@
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torchvision.models as models
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def make_transform(size : int = 512):
+    return transforms.Compose([
+        transforms.Resize((size, size)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+
+
+def build_vgg19(model_path : str, device : str, num_classes : int = 2) -> nn.Module:
+    """ 주인공 분류용 VGG19 (마지막 층만 num_classes로 바꾼 모델)에 학습된 가중치를 불러옵니다 """
+    model = models.vgg19(pretrained=False)
+    num_features = model.classifier[6].in_features
+    model.classifier[6] = nn.Linear(num_features, num_classes)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+
+STUDENT_ARCHS = ("mobilenet_v3_small", "mobilenet_v3_large", "resnet18")
+
+
+def build_student(arch : str = "mobilenet_v3_small", num_classes : int = 2, weights_path : str = None,
+                  device : str = "cpu", pretrained : bool = False) -> nn.Module:
+    """
+    증류용 경량 학생 모델 (224 px 입력). weights_path를 주면 학습된 가중치를 불러와 추론 모드로 반환합니다.
+    pretrained=True면 ImageNet 가중치로 시작합니다 (학습할 때만, 인터넷 연결 필요).
+    """
+    if arch not in STUDENT_ARCHS:
+        raise ValueError(f"arch must be one of {STUDENT_ARCHS}, got {arch}")
+
+    weights = "DEFAULT" if pretrained else None
+    model = getattr(models, arch)(weights=weights)
+    if arch == "resnet18":
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    else:
+        model.classifier[-1] = nn.Linear(model.classifier[-1].in_features, num_classes)
+
+    if weights_path is not None:
+        model.load_state_dict(torch.load(weights_path, map_location=device))
+        model.eval()
+    return model.to(device)
+
+
+def count_params(model : nn.Module) -> int:
+    return sum(p.numel() for p in model.parameters())
+
+
+def list_crops(direcs : list) -> list:
+    """ 폴더(glob 패턴 가능)들 안의 얼굴 크롭 이미지 경로 """
+    paths = []
+    for pattern in direcs:
+        for direc in sorted(glob.glob(pattern)):
+            paths.extend(p for ext in ("*.png", "*.jpg", "*.jpeg") for p in sorted(glob.glob(os.path.join(direc, ext))))
+    return paths
+
+
+def list_labeled(direc : str) -> tuple:
+    """ <direc>/<클래스 번호>/*.png 구조의 라벨된 크롭 -> (경로 리스트, 라벨 배열) """
+    paths, labels = [], []
+    for label_dir in sorted(os.listdir(direc)):
+        if not label_dir.isdigit():
+            continue
+        for path in list_crops([os.path.join(direc, label_dir)]):
+            paths.append(path)
+            labels.append(int(label_dir))
+    return paths, np.array(labels, dtype=np.int64)
+
+
+class CropDataset(Dataset):
+    """ 얼굴 크롭 파일 경로 리스트 -> (변환된 텐서, 순번). 디코딩과 변환은 DataLoader 작업 프로세스에서 진행됩니다 """
+
+    def __init__(self, paths : list, transform):
+        self.paths = paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        with Image.open(self.paths[index]) as img:
+            return self.transform(img.convert("RGB")), index
+
+
+class BatchClassifier():
+    """
+    얼굴 크롭을 배치로 분류합니다.
+    - DataLoader 작업 프로세스(num_workers)가 디코딩과 변환을 하는 동안 모델은 앞 배치를 계산합니다
+    - torch.inference_mode, channels_last 메모리 배치, (bf16=True면) bfloat16 autocast
+    - predict는 argmax 대신 크롭별 클래스 확률을 반환하고, 처리 속도(images/sec)를 stats에 남깁니다
+    """
+
+    def __init__(self, model : nn.Module, transform, device : str, batch_size : int = 16,
+                 num_workers : int = None, channels_last : bool = True, bf16 : bool = False):
+        self.device = torch.device(device)
+        self.transform = transform
+        self.batch_size = batch_size
+        self.num_workers = min(4, os.cpu_count() or 1) if num_workers is None else num_workers
+        self.channels_last = channels_last
+        self.bf16 = bf16
+
+        self.model = model.to(self.device).eval()
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        self.stats = {"images": 0, "seconds": 0.0, "images_per_sec": None}
+
+    def predict(self, paths : list) -> np.ndarray:
+        """ paths 순서대로 (N, 클래스 수) 확률 배열을 반환합니다 """
+        return self._run(paths, lambda logits: torch.softmax(logits.float(), dim=1))
+
+    def _run(self, paths : list, postprocess) -> np.ndarray:
+        """ 배치마다 모델 출력에 postprocess를 적용한 결과를 paths 순서대로 쌓아 반환합니다 """
+        if not paths:
+            return np.zeros((0, 0), dtype=np.float32)
+
+        loader = DataLoader(CropDataset(paths, self.transform), batch_size=self.batch_size, shuffle=False,
+                            num_workers=self.num_workers, pin_memory=self.device.type == "cuda")
+
+        start = time.perf_counter()
+        results = [None] * len(paths)
+        with torch.inference_mode(), torch.autocast(self.device.type, dtype=torch.bfloat16, enabled=self.bf16):
+            for images, indices in loader:
+                memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+                images = images.to(self.device, memory_format=memory_format, non_blocking=True)
+                outputs = postprocess(self.model(images)).float().cpu().numpy()
+                for index, output in zip(indices.tolist(), outputs):
+                    results[index] = output
+        elapsed = time.perf_counter() - start
+
+        self.stats["images"] += len(paths)
+        self.stats["seconds"] += elapsed
+        self.stats["images_per_sec"] = self.stats["images"] / self.stats["seconds"] if self.stats["seconds"] > 0 else None
+        return np.stack(results)
@@ -0,0 +1,178 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from manifest import load_json, write_json_atomic
+
+
+HASH_SIZE = 8        # 8 x 8 = 64비트 pHash
+HASH_IMAGE_SIZE = 32 # DCT를 계산하는 흑백 축소 이미지 크기
+MAX_DISTANCE = 6     # 이 해밍 거리 이하면 같은 얼굴로 묶습니다 (64비트 중)
+GROUPS_NAME = "face_groups.json"
+
+
+def _dct_matrix(n : int) -> np.ndarray:
+    """ 직교 DCT-II 행렬 (D @ x 가 x의 1차원 DCT) """
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+def load_gray(path : str, size : int = HASH_IMAGE_SIZE) -> np.ndarray:
+    with Image.open(path) as img:
+        return np.asarray(img.convert("L").resize((size, size), Image.LANCZOS), dtype=np.float64)
+
+
+def pixel_count(path : str) -> int:
+    with Image.open(path) as img:
+        return img.size[0] * img.size[1]
+
+
+def phash_batch(images : np.ndarray, hash_size : int = HASH_SIZE) -> np.ndarray:
+    """
+    (N, 32, 32) 흑백 배열 -> (N, hash_size * hash_size) bool pHash.
+    배치 전체의 2차원 DCT를 행렬곱 한 번으로 계산하고, 저주파 블록(DC 제외)의 중앙값보다 큰 계수를 1로 둡니다.
+    """
+    images = np.asarray(images, dtype=np.float64)
+    dct = _dct_matrix(images.shape[-1])
+    coefficients = dct @ images @ dct.T # (N, 32, 32)
+    low = coefficients[:, :hash_size, :hash_size].reshape(len(images), -1)
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return low > median
+
+
+def hamming_distances(hashes : np.ndarray, query : np.ndarray) -> np.ndarray:
+    """ (N, bits) bool 해시와 (bits,) 해시 하나 -> (N,) 해밍 거리 """
+    return np.count_nonzero(hashes != query, axis=1)
+
+
+def group_near_duplicates(hashes : np.ndarray, max_distance : int = MAX_DISTANCE, embeddings : np.ndarray = None,
+                          min_cosine : float = 0.95) -> np.ndarray:
+    """
+    순서대로 아직 묶이지 않은 첫 크롭을 기준으로, 기준과의 해시 거리가 max_distance 이하인 크롭을 한 묶음으로 만듭니다.
+    (기준과 직접 비교하므로 비슷한 크롭이 사슬처럼 이어져 서로 다른 얼굴이 묶이지 않습니다)
+    embeddings(L2 정규화)를 주면 코사인 유사도가 min_cosine 이상이어야 같은 묶음이 됩니다.
+    기준 하나와 아직 묶이지 않은 크롭들만 비교하므로 N x N 행렬을 만들지 않습니다 (메모리는 크롭 수에 비례).
+    크롭별 묶음 번호 배열을 반환합니다.
+    """
+    group_ids = np.full(len(hashes), -1, dtype=np.int64)
+    group = 0
+    for leader in range(len(hashes)):
+        if group_ids[leader] >= 0:
+            continue
+        rest = np.flatnonzero(group_ids < 0)
+        similar = hamming_distances(hashes[rest], hashes[leader]) <= max_distance
+        if embeddings is not None:
+            similar &= embeddings[rest] @ embeddings[leader] >= min_cosine
+        group_ids[rest[similar]] = group
+        group_ids[leader] = group
+        group += 1
+    return group_ids
+
+
+def hash_to_hex(bits : np.ndarray) -> str:
+    return np.packbits(bits).tobytes().hex()
+
+
+def hex_to_hash(text : str, bits : int = HASH_SIZE * HASH_SIZE) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(bytes.fromhex(text), dtype=np.uint8))[:bits].astype(bool)
+
+
+def list_crops(crop_direc : str, names : list = None) -> list:
+    if names is None:
+        names = os.listdir(crop_direc) if os.path.isdir(crop_direc) else []
+    return sorted(name for name in names if os.path.splitext(name)[1].lower() in (".png", ".jpg", ".jpeg")
+                  and os.path.isfile(os.path.join(crop_direc, name)))
+
+
+def crop_features(paths : list, workers : int = 8) -> tuple:
+    """ 크롭 경로들 -> ((N, 64) bool pHash, 픽셀 수 리스트) """
+    if not paths:
+        return np.zeros((0, HASH_SIZE * HASH_SIZE), dtype=bool), []
+    # 디코딩과 축소는 스레드 풀에서 (PIL은 디코딩 중 GIL을 놓습니다), 해시는 배치 한 번에 계산합니다
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        grays = np.stack(list(executor.map(load_gray, paths)))
+        sizes = list(executor.map(pixel_count, paths))
+    return phash_batch(grays), sizes
+
+
+def load_prior(episode : str, crop_direc : str, groups_path : str, names : list = None, workers : int = 8) -> dict:
+    """
+    앞 에피소드의 크롭 특징. 그 에피소드의 face_groups.json에 저장된 해시가 모든 크롭을 덮으면 다시 계산하지 않습니다
+    """
+    names = list_crops(crop_direc, names)
+    saved = load_json(groups_path, default={}).get("hashes", {})
+    if names and all(name in saved for name in names):
+        hashes = np.stack([hex_to_hash(saved[name]["phash"]) for name in names])
+        sizes = [saved[name]["pixels"] for name in names]
+    else:
+        hashes, sizes = crop_features([os.path.join(crop_direc, name) for name in names], workers)
+    return {"episode": str(episode), "crop_direc": crop_direc, "names": names, "hashes": hashes, "sizes": sizes}
+
+
+def dedup_faces(crop_direc : str, output_path : str, max_distance : int = MAX_DISTANCE, embedder=None,
+                min_cosine : float = 0.95, workers : int = 8, names : list = None, prior : list = None) -> dict:
+    """
+    crop_direc의 크롭(names를 주면 그 파일들만)을 pHash(선택적으로 임베딩)로 묶어 output_path(JSON)에 저장합니다.
+    스타일 변환은 묶음의 대표만 하고 결과를 묶음 전체에 복사합니다.
+    embedder : 크롭 경로 리스트 -> L2 정규화된 (N, D) 임베딩을 돌려주는 함수 (예: cascade.Embedder(...).embed)
+    prior : 앞 에피소드들의 크롭 특징(load_prior) 리스트. 주면 에피소드를 넘어 함께 묶고, 앞 에피소드의 크롭이 먼저 기준이 됩니다.
+            대표는 묶음에서 가장 앞 에피소드의 가장 큰 크롭이며, 다른 에피소드의 크롭이면 그 에피소드 번호를 "episode"에 남깁니다
+            (그 에피소드의 변환 결과를 복사해 오면 됩니다). 이 에피소드의 크롭이 없는 묶음은 저장하지 않습니다.
+    """
+    names = list_crops(crop_direc, names)
+    paths = [os.path.join(crop_direc, name) for name in names]
+    hashes, sizes = crop_features(paths, workers)
+
+    # 앞 에피소드의 크롭을 먼저 두어 기준(leader)이 되게 합니다
+    sources = [(p["episode"], p["crop_direc"], p["names"], p["hashes"], p["sizes"]) for p in (prior or [])]
+    sources.append((None, crop_direc, names, hashes, sizes))
+    owners = [(episode, direc, name, size) for episode, direc, source_names, _, source_sizes in sources
+              for name, size in zip(source_names, source_sizes)]
+
+    groups = []
+    if names:
+        all_hashes = np.concatenate([source[3] for source in sources])
+        embeddings = None
+        if embedder is not None:
+            embeddings = np.asarray(embedder([os.path.join(direc, name) for _, direc, name, _ in owners]), dtype=np.float64)
+        group_ids = group_near_duplicates(all_hashes, max_distance, embeddings, min_cosine)
+
+        local_start = len(owners) - len(names)
+        for group in np.unique(group_ids[local_start:]):
+            members = np.flatnonzero(group_ids == group).tolist()
+            first_source = owners[members[0]][0]
+            representative = max((i for i in members if owners[i][0] == first_source), key=lambda i: (owners[i][3], -i))
+            groups.append({"representative": owners[representative][2], "episode": owners[representative][0],
+                           "members": [owners[i][2] for i in members if i >= local_start]})
+
+    report = {
+        "max_distance": max_distance,
+        "min_cosine": min_cosine if embedder is not None else None,
+        "prior_episodes": [p["episode"] for p in (prior or [])],
+        "crops": len(names),
+        "representatives": sum(group["episode"] is None for group in groups),
+        "reused_from_prior": sum(len(group["members"]) for group in groups if group["episode"] is not None),
+        "groups": groups,
+        "hashes": {name: {"phash": hash_to_hex(bits), "pixels": int(size)} for name, bits, size in zip(names, hashes, sizes)},
+    }
+    write_json_atomic(output_path, report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="주인공 얼굴 크롭의 중복(거의 같은 얼굴) 묶기")
+    parser.add_argument("crops", help="크롭 폴더 (예: results/1/cropped_faces)")
+    parser.add_argument("--output", default=None, help=f"기본값 : <크롭 폴더의 상위 폴더>/{GROUPS_NAME}")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE)
+    args = parser.parse_args()
+
+    output = args.output or os.path.join(os.path.dirname(os.path.abspath(args.crops)), GROUPS_NAME)
+    report = dedup_faces(args.crops, output, max_distance=args.max_distance)
+    print(json.dumps({key: report[key] for key in ("crops", "representatives")}, indent=4))
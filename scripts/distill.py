@@ -0,0 +1,158 @@
+import argparse
+import json
+import os
+import random
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from classifier import (IMAGENET_MEAN, IMAGENET_STD, STUDENT_ARCHS, BatchClassifier, build_student,
+                        build_vgg19, count_params, list_crops, list_labeled, make_transform)
+from manifest import write_json_atomic
+
+
+class SoftTargetDataset(Dataset):
+    """ (크롭 경로, 교사 확률) -> (증강된 224 px 텐서, 교사 확률) """
+
+    def __init__(self, paths : list, targets : np.ndarray, transform):
+        self.paths = paths
+        self.targets = torch.from_numpy(np.asarray(targets, dtype=np.float32))
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        with Image.open(self.paths[index]) as img:
+            return self.transform(img.convert("RGB")), self.targets[index]
+
+
+def distillation_loss(student_logits : torch.Tensor, teacher_probs : torch.Tensor, temperature : float) -> torch.Tensor:
+    """ 온도 temperature로 부드럽게 만든 교사 분포와 학생 분포의 KL divergence (T^2 배) """
+    soft_targets = F.softmax(torch.log(teacher_probs.clamp_min(1e-8)) / temperature, dim=1)
+    log_student = F.log_softmax(student_logits / temperature, dim=1)
+    return F.kl_div(log_student, soft_targets, reduction="batchmean") * temperature ** 2
+
+
+def train_student(student, paths : list, targets : np.ndarray, device : str, epochs : int = 10, batch_size : int = 32,
+                  lr : float = 3e-4, temperature : float = 4.0, num_workers : int = 2, image_size : int = 224):
+    train_transform = transforms.Compose([
+        transforms.RandomResizedCrop(image_size, scale=(0.8, 1.0), ratio=(0.9, 1.1)),
+        transforms.RandomHorizontalFlip(),
+        transforms.ColorJitter(0.2, 0.2, 0.2),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+    loader = DataLoader(SoftTargetDataset(paths, targets, train_transform), batch_size=batch_size, shuffle=True,
+                        num_workers=num_workers, drop_last=len(paths) > batch_size)
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=max(1, epochs * len(loader)))
+
+    student.train()
+    for epoch in range(epochs):
+        total, count = 0.0, 0
+        for images, teacher_probs in loader:
+            images, teacher_probs = images.to(device), teacher_probs.to(device)
+            loss = distillation_loss(student(images), teacher_probs, temperature)
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            total += loss.item() * len(images)
+            count += len(images)
+        print(f"epoch {epoch + 1}/{epochs} | kd loss {total / max(count, 1):.4f}")
+    student.eval()
+    return student
+
+
+def distill(crop_direcs : list, teacher_path : str, output_path : str, arch : str = "mobilenet_v3_small",
+            labeled_direc : str = None, val_fraction : float = 0.2, epochs : int = 10, batch_size : int = 32,
+            lr : float = 3e-4, temperature : float = 4.0, pretrained : bool = False, device : str = None,
+            num_workers : int = 2, seed : int = 0) -> dict:
+    """
+    교사(VGG19, 512 px)의 확률을 크롭 코퍼스에 대해 한 번 계산하고, 이를 따라하도록 학생(224 px)을 학습합니다.
+    학생 가중치는 output_path에, 정확도와 처리 속도 비교는 <output_path 이름>.report.json 에 저장합니다.
+    """
+    device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+    random.seed(seed)
+    torch.manual_seed(seed)
+
+    paths = list_crops(crop_direcs)
+    if not paths:
+        raise FileNotFoundError(f"No crops found in {crop_direcs}")
+    random.shuffle(paths)
+    num_val = int(len(paths) * val_fraction)
+    val_paths, train_paths = paths[:num_val], paths[num_val:]
+
+    # 1) 교사 확률 (soft label)
+    teacher = BatchClassifier(build_vgg19(teacher_path, device), make_transform(512), device,
+                              batch_size=batch_size, num_workers=num_workers)
+    print(f"Teacher labelling {len(paths)} crops")
+    train_targets = teacher.predict(train_paths)
+    val_teacher = teacher.predict(val_paths) if val_paths else np.zeros((0, 2), dtype=np.float32)
+
+    # 2) 학생 학습
+    student = build_student(arch, num_classes=train_targets.shape[1], device=device, pretrained=pretrained)
+    student = train_student(student, train_paths, train_targets, device, epochs=epochs, batch_size=batch_size,
+                            lr=lr, temperature=temperature, num_workers=num_workers)
+    torch.save(student.state_dict(), output_path)
+
+    # 3) 비교 (처리 속도는 같은 크롭으로 CPU에서 측정합니다)
+    bench_paths = val_paths or train_paths[:256]
+    student_clf = BatchClassifier(student, make_transform(224), device, batch_size=batch_size, num_workers=num_workers)
+    val_student = student_clf.predict(val_paths) if val_paths else np.zeros((0, 2), dtype=np.float32)
+
+    report = {
+        "arch": arch,
+        "train_crops": len(train_paths),
+        "val_crops": len(val_paths),
+        "val_agreement": float((val_student.argmax(1) == val_teacher.argmax(1)).mean()) if val_paths else None,
+        "teacher": {"arch": "vgg19", "input_size": 512, "params": count_params(teacher.model)},
+        "student": {"arch": arch, "input_size": 224, "params": count_params(student)},
+    }
+
+    if labeled_direc is not None:
+        labeled_paths, labels = list_labeled(labeled_direc)
+        if len(labeled_paths):
+            report["labeled"] = {
+                "crops": len(labeled_paths),
+                "teacher_accuracy": float((teacher.predict(labeled_paths).argmax(1) == labels).mean()),
+                "student_accuracy": float((student_clf.predict(labeled_paths).argmax(1) == labels).mean()),
+            }
+
+    for name, model, size in [("teacher", teacher.model, 512), ("student", student, 224)]:
+        cpu_clf = BatchClassifier(model.to("cpu"), make_transform(size), "cpu", batch_size=batch_size, num_workers=num_workers)
+        cpu_clf.predict(bench_paths)
+        report[name]["cpu_images_per_sec"] = cpu_clf.stats["images_per_sec"]
+    report["cpu_speedup"] = report["student"]["cpu_images_per_sec"] / report["teacher"]["cpu_images_per_sec"]
+
+    write_json_atomic(f"{os.path.splitext(output_path)[0]}.report.json", report)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="VGG19 주인공 분류기를 경량 학생 모델로 증류")
+    parser.add_argument("crops", nargs="+", help="얼굴 크롭 폴더 (glob 가능, 예: 'results/*/temporary_crops')")
+    parser.add_argument("--teacher", default="model_weights.pth")
+    parser.add_argument("--output", default="student_weights.pth")
+    parser.add_argument("--arch", default="mobilenet_v3_small", choices=STUDENT_ARCHS)
+    parser.add_argument("--labeled", default=None, help="<폴더>/<클래스 번호>/*.png 형태의 정답 크롭 (정확도 비교용)")
+    parser.add_argument("--val-fraction", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=3e-4)
+    parser.add_argument("--temperature", type=float, default=4.0)
+    parser.add_argument("--pretrained", action="store_true", help="ImageNet 가중치로 학생을 초기화 (다운로드 필요)")
+    parser.add_argument("--device", default=None)
+    parser.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    report = distill(args.crops, args.teacher, args.output, arch=args.arch, labeled_direc=args.labeled,
+                     val_fraction=args.val_fraction, epochs=args.epochs, batch_size=args.batch_size, lr=args.lr,
+                     temperature=args.temperature, pretrained=args.pretrained, device=args.device, num_workers=args.workers)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
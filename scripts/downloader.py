@@ -0,0 +1,151 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from http_utils import RETRY_STATUS, HostLimiter, make_session, request_with_retry, retry_after
+from manifest import DownloadManifest
+
+
+class EpisodeDownloader():
+    """
+    keep-alive 세션 하나와 제한된 스레드 풀로 뷰어 페이지와 이미지를 동시에 받아옵니다.
+    - 호스트별 동시 요청 수 제한 (per_host)
+    - 연결 오류 / 429 / 5xx 응답은 지수 백오프로 재시도
+    - 이미지는 받는 즉시 디스크에 쓰고, 에피소드별 manifest.json으로 이어받기를 지원
+    """
+
+    def __init__(self, headers : dict = None, max_workers : int = 8, per_host : int = 4,
+                 timeout=(5, 30), retries : int = 3, backoff : float = 0.5, chunk_size : int = 1 << 16):
+        self.session = make_session(headers, pool_size=max_workers)
+        self.limiter = HostLimiter(per_host)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def get(self, url : str, **kwargs) -> requests.Response:
+        """ 호스트 슬롯은 시도마다 잡고, 재시도 대기 중에는 놓습니다 """
+        return request_with_retry(self.session, "GET", url, retries=self.retries, backoff=self.backoff,
+                                  timeout=self.timeout, slot=self.limiter(url), **kwargs)
+
+    def get_text(self, url : str) -> str:
+        response = self.get(url)
+        response.raise_for_status()
+        return response.text
+
+    def download_file(self, url : str, path : str) -> int:
+        """
+        이미지를 스트리밍으로 path.part에 쓰고, 끝까지 받은 경우에만 path로 옮깁니다. 받은 바이트 수를 반환합니다.
+        재시도는 이 함수의 반복문 한 곳에서만 합니다 (연결 오류, 429 / 5xx 응답, 본문이 중간에 끊긴 경우).
+        """
+        tmp_path = f"{path}.part"
+
+        for attempt in range(self.retries + 1):
+            delay = self.backoff * (2 ** attempt)
+            try:
+                with self.limiter(url):
+                    response = request_with_retry(self.session, "GET", url, retries=0, timeout=self.timeout, stream=True)
+                    with response:
+                        retry = response.status_code in RETRY_STATUS and attempt < self.retries
+                        if retry:
+                            delay = retry_after(response, delay)
+                        else:
+                            response.raise_for_status()
+                            num_bytes = 0
+                            with open(tmp_path, "wb") as f:
+                                for chunk in response.iter_content(chunk_size=self.chunk_size):
+                                    f.write(chunk)
+                                    num_bytes += len(chunk)
+
+                if not retry:
+                    expected = response.headers.get("Content-Length")
+                    if expected is not None and "Content-Encoding" not in response.headers and int(expected) != num_bytes:
+                        raise requests.ConnectionError(f"Truncated body: {num_bytes}/{expected} bytes")
+
+                    os.replace(tmp_path, path)
+                    return num_bytes
+
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+                if attempt == self.retries:
+                    raise
+            time.sleep(delay) # 호스트 동시 요청 슬롯을 놓은 뒤에 기다립니다
+
+    def download_episodes(self, episodes : list, rawdata_direc : str, parse_image_urls) -> set:
+        """
+        episodes : [(에피소드 제목, 뷰어 페이지 url, ...), ...]
+        parse_image_urls : 뷰어 페이지 html -> {순번: 이미지 url}
+
+        manifest에 완료로 기록된 에피소드는 뷰어 페이지도 다시 요청하지 않습니다.
+        끝까지 받지 못한 에피소드 제목의 집합을 반환합니다.
+        """
+        failed = set()
+        page_futures = {}
+        for episode_title, episode_link, *_ in episodes:
+            episode_direc = os.path.join(rawdata_direc, episode_title)
+            os.makedirs(episode_direc, exist_ok=True)
+
+            manifest = DownloadManifest(episode_direc)
+            if manifest.complete:
+                print(f"Episode {episode_title} is already saved, skipping")
+                continue
+
+            future = self.executor.submit(self.get_text, episode_link)
+            page_futures[future] = (episode_title, episode_link, manifest)
+
+        image_futures = {}
+        remaining = {}
+
+        # 뷰어 페이지가 도착하는 대로 이미지 다운로드를 풀에 넣습니다
+        for future in as_completed(page_futures):
+            episode_title, episode_link, manifest = page_futures[future]
+            try:
+                image_urls = parse_image_urls(future.result())
+            except Exception as e:
+                print(f"Failed to fetch episode {episode_title} ({e})")
+                failed.add(episode_title)
+                continue
+
+            remaining[episode_title] = 0
+            for idx, url in image_urls.items():
+                img_path = os.path.join(manifest.episode_direc, f"{idx}.jpg")
+                if manifest.is_done(idx, url, img_path):
+                    continue
+                image_future = self.executor.submit(self.download_file, url, img_path)
+                image_futures[image_future] = (episode_title, episode_link, manifest, idx, url)
+                remaining[episode_title] += 1
+
+            if remaining[episode_title] == 0:
+                manifest.mark_complete(episode_link)
+                print(f"Episode {episode_title} is saved!")
+
+        for future in as_completed(image_futures):
+            episode_title, episode_link, manifest, idx, url = image_futures[future]
+            try:
+                manifest.mark_done(idx, url, future.result())
+            except Exception as e:
+                print(f"Failed to download {url} ({e})")
+                failed.add(episode_title)
+
+            remaining[episode_title] -= 1
+            if remaining[episode_title] == 0:
+                if episode_title in failed:
+                    print(f"Episode {episode_title} is incomplete, run again to resume")
+                else:
+                    manifest.mark_complete(episode_link)
+                    print(f"Episode {episode_title} is saved!")
+
+        return failed
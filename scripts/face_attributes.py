@@ -0,0 +1,114 @@
+import numpy as np
+
+
+# Face++ detect 응답(return_attributes=headpose,facequality,blur,eyestatus)에서 꺼내는 속성
+ATTRIBUTES = ("yaw", "pitch", "roll", "facequality", "blur", "eye_open")
+
+
+def face_attributes(face : dict) -> dict:
+    """
+    Face++ 얼굴 하나의 attributes를 평평한 dict로 꺼냅니다. 응답에 없는 값은 None (로컬 dlib 백엔드는 모두 None)
+    - yaw / pitch / roll : headpose 각도 (도)
+    - facequality : 얼굴 품질 점수 (0~100, 높을수록 좋음)
+    - blur : blurness 점수 (0~100, 높을수록 흐림)
+    - eye_open : 두 눈의 뜬 눈 확률 평균 (0~100, 안경 유무 합산)
+    """
+    attributes = face.get("attributes") or {}
+    headpose = attributes.get("headpose") or {}
+    facequality = attributes.get("facequality") or {}
+    blurness = (attributes.get("blur") or {}).get("blurness") or {}
+    eyestatus = attributes.get("eyestatus") or {}
+
+    eye_open = None
+    eyes = [eyestatus.get(f"{side}_eye_status") for side in ("left", "right")]
+    if all(eyes):
+        eye_open = sum(eye.get("no_glass_eye_open", 0) + eye.get("normal_glass_eye_open", 0) for eye in eyes) / 2
+
+    return {
+        "yaw": headpose.get("yaw_angle"),
+        "pitch": headpose.get("pitch_angle"),
+        "roll": headpose.get("roll_angle"),
+        "facequality": facequality.get("value"),
+        "blur": blurness.get("value"),
+        "eye_open": eye_open,
+    }
+
+
+class AttributeFilter():
+    """
+    얼굴 속성 조건. None인 조건은 검사하지 않습니다.
+    missing : 속성이 없는 얼굴(로컬 백엔드 라벨 등)의 처리. "pass"면 통과, "reject"면 탈락
+    """
+    MISSING = ("pass", "reject")
+
+    def __init__(self, max_abs_yaw : float = None, max_abs_pitch : float = None, min_facequality : float = None,
+                 max_blur : float = None, min_eye_open : float = None, missing : str = "pass"):
+        if missing not in self.MISSING:
+            raise ValueError(f"missing must be one of {self.MISSING}, got {missing}")
+        self.max_abs_yaw = max_abs_yaw
+        self.max_abs_pitch = max_abs_pitch
+        self.min_facequality = min_facequality
+        self.max_blur = max_blur
+        self.min_eye_open = min_eye_open
+        self.missing = missing
+
+    def predicates(self) -> list:
+        """ (탈락 사유, 속성 이름, 통과 조건 함수) 리스트. 앞의 조건부터 사유로 기록됩니다 """
+        predicates = []
+        if self.max_abs_yaw is not None:
+            predicates.append(("yaw", "yaw", lambda v: np.abs(v) <= self.max_abs_yaw))
+        if self.max_abs_pitch is not None:
+            predicates.append(("pitch", "pitch", lambda v: np.abs(v) <= self.max_abs_pitch))
+        if self.min_facequality is not None:
+            predicates.append(("low_facequality", "facequality", lambda v: v >= self.min_facequality))
+        if self.max_blur is not None:
+            predicates.append(("blur", "blur", lambda v: v <= self.max_blur))
+        if self.min_eye_open is not None:
+            predicates.append(("eyes_closed", "eye_open", lambda v: v >= self.min_eye_open))
+        return predicates
+
+    def config(self) -> dict:
+        """ 단계 fingerprint와 보고서에 남기는 설정 """
+        return {"max_abs_yaw": self.max_abs_yaw, "max_abs_pitch": self.max_abs_pitch, "min_facequality": self.min_facequality,
+                "max_blur": self.max_blur, "min_eye_open": self.min_eye_open, "missing": self.missing}
+
+
+class AttributeIndex():
+    """
+    라벨 저장소(LabelStore)의 모든 얼굴 속성을 속성별 배열 하나씩(열 방향)으로 모은 색인.
+    (컷 이름, 얼굴 번호) 순서의 행마다 속성 값이 있고, 없는 값은 NaN입니다.
+    select(filter)는 조건을 배열 연산으로 한 번에 평가하여 얼굴별 탈락 사유를 돌려줍니다.
+    """
+
+    def __init__(self, labels):
+        self.rows = [] # (컷 이름, 얼굴 번호 (1부터, naive_face_crop의 _face<n>과 같음))
+        values = {name: [] for name in ATTRIBUTES}
+        for panel in labels.keys():
+            for idx, face in enumerate(labels.faces(panel) or [], start=1):
+                self.rows.append((panel, idx))
+                for name, value in face_attributes(face).items():
+                    values[name].append(np.nan if value is None else float(value))
+        self.columns = {name: np.asarray(column, dtype=np.float64) for name, column in values.items()}
+        self.positions = {row: i for i, row in enumerate(self.rows)}
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def select(self, face_filter : AttributeFilter) -> dict:
+        """ {(컷 이름, 얼굴 번호): 탈락 사유} (통과한 얼굴은 들어있지 않습니다) """
+        reasons = np.full(len(self.rows), None, dtype=object)
+        for reason, name, passes in face_filter.predicates():
+            column = self.columns[name]
+            present = ~np.isnan(column)
+            failed = np.zeros(len(column), dtype=bool)
+            failed[present] = ~passes(column[present])
+            undecided = reasons == None # noqa: E711 (object 배열의 원소별 비교)
+            reasons[failed & undecided] = reason
+            if face_filter.missing == "reject":
+                reasons[~present & undecided] = "missing_attributes"
+
+        return {self.rows[i]: reasons[i] for i in np.flatnonzero(reasons != None)} # noqa: E711
+
+    def attributes(self, panel : str, idx : int) -> dict:
+        row = self.positions[(panel, idx)]
+        return {name: (None if np.isnan(column[row]) else float(column[row])) for name, column in self.columns.items()}
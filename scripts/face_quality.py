@@ -0,0 +1,36 @@
+import numpy as np
+
+
+MIN_RESOLUTION = 100   # 픽셀
+MIN_SHARPNESS = 30.0   # 라플라시안 분산
+MIN_CONTRAST = 8.0     # 밝기 표준편차
+
+
+def crop_quality(crop : np.ndarray) -> dict:
+    """
+    얼굴 크롭(RGB 배열)의 품질 지표 (파일로 저장하지 않고 메모리에서 계산합니다)
+    - sharpness : 4-이웃 라플라시안의 분산 (흐리거나 뭉개진 크롭일수록 작습니다)
+    - contrast : 밝기의 표준편차 (거의 단색인 크롭일수록 작습니다)
+    """
+    height, width = crop.shape[:2]
+    gray = crop.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32) if crop.ndim == 3 else crop.astype(np.float32)
+
+    if height >= 3 and width >= 3:
+        laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]) - 4 * gray[1:-1, 1:-1]
+        sharpness = float(laplacian.var())
+    else:
+        sharpness = 0.0
+
+    return {"width": int(width), "height": int(height), "sharpness": sharpness, "contrast": float(gray.std())}
+
+
+def quality_gate(metrics : dict, min_resolution : int = MIN_RESOLUTION, min_sharpness : float = MIN_SHARPNESS,
+                 min_contrast : float = MIN_CONTRAST):
+    """ 통과하면 None, 아니면 탈락 사유 문자열 """
+    if metrics["width"] < min_resolution or metrics["height"] < min_resolution:
+        return "low_resolution"
+    if metrics["contrast"] < min_contrast:
+        return "low_contrast"
+    if metrics["sharpness"] < min_sharpness:
+        return "blurry"
+    return None
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from http_utils import TokenBucket, make_session, retry_after
+from manifest import ContentCache
+from panel_store import encode_array
+
+
+class FaceDetector(ABC):
+    """
+    DataJoonbiJoonbi가 라벨을 만들 때 쓰는 얼굴 검출기 인터페이스.
+    detect / submit 모두 Face++ detect 응답과 같은 형식의 dict (실패 시 None)를 돌려줘야 합니다.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        pass
+
+    @abstractmethod
+    def detect(self, image_bytes : bytes) -> dict:
+        """ 이미지 한 장의 라벨을 반환합니다 """
+
+    @abstractmethod
+    def submit(self, image_path : str):
+        """ image_path의 라벨을 비동기로 계산하는 Future를 반환합니다 """
+
+    @abstractmethod
+    def submit_array(self, panel : np.ndarray):
+        """ RGB 배열(패널 인덱스의 view 등)의 라벨을 비동기로 계산하는 Future를 반환합니다 """
+
+
+class FacePlusPlusClient(FaceDetector):
+    """
+    Face++ detect API 클라이언트.
+    - 스레드 풀로 최대 max_in_flight개의 요청을 동시에 보내되, 토큰 버킷으로 초당 qps개를 넘지 않게 합니다
+    - CONCURRENCY_LIMIT_EXCEEDED, 429, 5xx 응답은 지수 백오프로 재시도합니다
+    - 응답은 cache_direc에 이미지 내용의 sha1로 저장하여, 같은 컷은 다시 요청하지 않습니다
+    """
+    API_URL = "https://api-us.faceplusplus.com/facepp/v3/detect"
+    RETURN_ATTRIBUTES = "gender,age,smiling,headpose,facequality,blur,eyestatus,emotion"
+    RETRY_ERRORS = ("CONCURRENCY_LIMIT_EXCEEDED",)
+
+    def __init__(self, api_key : str, api_secret : str, cache_direc : str = None, api_url : str = API_URL,
+                 qps : float = 1.0, max_in_flight : int = 4, retries : int = 5, backoff : float = 1.0, timeout=(5, 60)):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.api_url = api_url
+        self.cache = ContentCache(cache_direc) if cache_direc is not None else None
+
+        self.session = make_session(pool_size=max_in_flight)
+        self.bucket = TokenBucket(qps) # 버스트 없이 일정한 간격으로 보냅니다
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.stats = {"requests": 0, "cache_hits": 0, "retries": 0}
+        self._stats_lock = threading.Lock()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit(self, image_path : str):
+        """ detect_file을 스레드 풀에 넣고 Future를 반환합니다 """
+        return self.executor.submit(self.detect_file, image_path)
+
+    def submit_array(self, panel : np.ndarray):
+        """ PNG 인코딩도 스레드 풀에서 진행합니다 """
+        return self.executor.submit(self.detect_array, panel)
+
+    def detect_array(self, panel : np.ndarray) -> dict:
+        return self.detect(encode_array(panel, "PNG"))
+
+    def detect_file(self, image_path : str) -> dict:
+        with open(image_path, "rb") as f:
+            return self.detect(f.read())
+
+    def detect(self, image_bytes : bytes) -> dict:
+        """
+        이미지 한 장의 얼굴 라벨(Face++ 응답 JSON)을 반환합니다. 끝내 받지 못하면 None을 반환합니다.
+        """
+        cache_key = ContentCache.key(image_bytes)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+
+        data = {
+            "api_key": self.api_key,
+            "api_secret": self.api_secret,
+            "return_landmark": "1",
+            "return_attributes": self.RETURN_ATTRIBUTES,
+        }
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            self._count("requests")
+            delay = self.backoff * (2 ** attempt)
+            try:
+                response = self.session.post(self.api_url, data=data, files={"image_file": ("panel.png", image_bytes)},
+                                             timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                label, retry = None, True
+                print(f"Face++ request failed ({e})")
+            else:
+                try:
+                    label = response.json()
+                except json.JSONDecodeError:
+                    print("Failed to decode JSON. Response content:", response.text)
+                    label = None
+                retry = self._should_retry(response, label)
+                delay = retry_after(response, delay)
+
+            if not retry:
+                break
+            if attempt < self.retries:
+                self._count("retries")
+                time.sleep(delay)
+        else:
+            return None
+
+        # 영구적인 오류(예: INVALID_IMAGE_SIZE)도 저장해 두면 같은 컷에 다시 할당량을 쓰지 않습니다
+        if label is not None and self.cache is not None and response.status_code < 500 and response.status_code not in (401, 403, 429):
+            self.cache.put(cache_key, label)
+
+        return label
+
+    def _should_retry(self, response : requests.Response, label : dict) -> bool:
+        if response.status_code == 429 or response.status_code >= 500:
+            return True
+        error_message = (label or {}).get("error_message", "")
+        return any(error in error_message for error in self.RETRY_ERRORS)
+
+    def _count(self, key : str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
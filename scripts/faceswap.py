@@ -1,6 +1,34 @@
 import requests
 import os
+import io
 import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+from PIL import Image
+
+from http_utils import TokenBucket, make_session, request_with_retry
+
+
+@lru_cache(maxsize=64)
+def _encoded_file(image_path: str, mtime_ns: int, size: int) -> str:
+    """ (경로, 수정 시각, 크기)별 base64 문자열. 파일이 바뀌면 키가 달라져 다시 읽습니다 """
+    with open(image_path, 'rb') as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+
+def is_valid_image(path: str) -> bool:
+    """ 비어있지 않고 디코딩할 수 있는 이미지 파일인지 확인 """
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return False
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
 
 class FaceSwapper:
     """
@@ -9,16 +37,31 @@ class FaceSwapper:
       - 기본적으로 folder_number=112(예: results/112/...) 폴더를 사용.
       - 생성자에서 project 루트까지의 경로를 찾아내어,
         style_transferred_images, real_faces, face_swapped_images 폴더를 자동으로 할당함.
+      - (실제 얼굴, 웹툰 얼굴) 쌍을 max_workers개의 스레드로 동시에 요청합니다. keep-alive 세션을 공유하고,
+        429 / 5xx / 연결 오류는 지수 백오프로 재시도하며, qps를 주면 초당 요청 수를 제한합니다.
+      - 이미 올바른 _fs.jpg가 있는 쌍은 건너뛰므로(overwrite=False), 중단 후 다시 실행하면 남은 쌍만 요청합니다.
     """
 
-    def __init__(self, 
-                 api_key: str, 
-                 folder_number: int = 112, 
-                 url: str = "https://api.segmind.com/v1/faceswap-v3"):
+    def __init__(self,
+                 api_key: str,
+                 folder_number: int = 112,
+                 url: str = "https://api.segmind.com/v1/faceswap-v3",
+                 max_workers: int = 4,
+                 qps: float = None,
+                 retries: int = 3,
+                 backoff: float = 1.0,
+                 timeout=(5, 120),
+                 overwrite: bool = False):
         self.api_key = api_key
         self.folder_number = folder_number
         self.url = url
-        
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.overwrite = overwrite
+        self.bucket = TokenBucket(qps) if qps is not None else None
+
         # 현재 faceswap.py 파일이 있는 scripts 디렉토리 경로
         script_dir = os.path.dirname(os.path.abspath(__file__))
         # project 루트 디렉토리 (scripts 폴더의 상위)
@@ -36,62 +79,96 @@ class FaceSwapper:
         # 결과물이 저장될 기본 폴더 생성
         os.makedirs(self.output_dir, exist_ok=True)
 
+        self.stats = {"swapped": 0, "skipped": 0, "failed": 0}
+        self._stats_lock = threading.Lock()
+
     @staticmethod
     def image_file_to_base64(image_path: str) -> str:
-        """이미지 파일을 base64 문자열로 변환"""
-        with open(image_path, 'rb') as f:
-            image_data = f.read()
-        return base64.b64encode(image_data).decode('utf-8')
+        """이미지 파일을 base64 문자열로 변환 (같은 파일은 한 번만 읽고 인코딩합니다)"""
+        stat = os.stat(image_path)
+        return _encoded_file(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
 
-    def swap_faces(self) -> None:
+    def swap_faces(self) -> dict:
         """
         webtoon_dataset_path의 웹툰 얼굴 이미지를
         real_dataset_path의 실제 얼굴 이미지와 합성 후
         output_dir에 저장한다.
+        실패한 쌍의 목록과 이번 호출의 처리 개수를 반환합니다.
         """
+        with self._stats_lock:
+            self.stats = {"swapped": 0, "skipped": 0, "failed": 0}
+
         # 폴더 내 파일 목록(불필요한 파일 제외)
-        webtoon_files = [f for f in os.listdir(self.webtoon_dataset_path) 
-                         if f != ".DS_Store" and not f.startswith("_")]
-        real_files = [f for f in os.listdir(self.real_dataset_path) 
-                      if f != ".DS_Store" and not f.startswith("_")]
+        webtoon_files = sorted(f for f in os.listdir(self.webtoon_dataset_path)
+                               if f != ".DS_Store" and not f.startswith("_"))
+        real_files = sorted(f for f in os.listdir(self.real_dataset_path)
+                            if f != ".DS_Store" and not f.startswith("_"))
 
+        # 실제 얼굴별로 결과 저장 폴더를 생성
         for real_face in real_files:
-            # 실제 얼굴 파일명에서 확장자를 뺀 이름
-            face_jooin = os.path.splitext(real_face)[0]
-            target_path = os.path.join(self.real_dataset_path, real_face)
-
-            # 실제 얼굴별로 결과 저장 폴더를 생성
-            result_dir = os.path.join(self.output_dir, face_jooin)
-            os.makedirs(result_dir, exist_ok=True)
-
-            for webtoon_face in webtoon_files:
-                # 웹툰 얼굴 파일명에서 확장자를 뺀 이름
-                file_name = os.path.splitext(webtoon_face)[0]
-                source_path = os.path.join(self.webtoon_dataset_path, webtoon_face)
-
-                # API에 전송할 JSON 데이터
-                data = {
-                    "source_img": self.image_file_to_base64(target_path),
-                    "target_img": self.image_file_to_base64(source_path),
-                    "input_faces_index": 0,
-                    "source_faces_index": 0,
-                    "face_restore": "codeformer-v0.1.0.pth",
-                    "image_quality": 100,
-                    "base64": False
-                }
-
-                # API 요청 헤더
-                headers = {
-                    'x-api-key': self.api_key
-                }
-
-                # API 요청
-                response = requests.post(self.url, json=data, headers=headers)
-
-                # 최종 결과물 이미지 경로
-                final_path = os.path.join(result_dir, f"{file_name}_fs.jpg")
-
-                # 이미지 저장
-                with open(final_path, "wb") as f:
-                    f.write(response.content)
+            os.makedirs(os.path.join(self.output_dir, os.path.splitext(real_face)[0]), exist_ok=True)
+
+        # 웹툰 얼굴 하나에 대한 요청을 이어서 보내므로, 인코딩한 웹툰 얼굴은 캐시에서 바로 재사용됩니다
+        jobs = []
+        for webtoon_face in webtoon_files:
+            source_path = os.path.join(self.webtoon_dataset_path, webtoon_face)
+            for real_face in real_files:
+                target_path = os.path.join(self.real_dataset_path, real_face)
+                final_path = os.path.join(self.output_dir, os.path.splitext(real_face)[0],
+                                          f"{os.path.splitext(webtoon_face)[0]}_fs.jpg")
+                if not self.overwrite and is_valid_image(final_path):
+                    self._count("skipped")
+                    continue
+                jobs.append((target_path, source_path, final_path))
+
+        failures = []
+        with make_session(headers={'x-api-key': self.api_key}, pool_size=self.max_workers) as session, \
+             ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.swap_pair, session, *job): job for job in jobs}
+            for future in as_completed(futures):
+                target_path, source_path, final_path = futures[future]
+                try:
+                    future.result()
+                    self._count("swapped")
+                except Exception as e:
+                    self._count("failed")
+                    failures.append({"real": target_path, "webtoon": source_path, "error": str(e)})
+                    print(f" Face swap failed: {os.path.basename(source_path)} x {os.path.basename(target_path)} ({e})")
+
+        print(f" Face swap : {self.stats['swapped']} swapped, {self.stats['skipped']} skipped, {self.stats['failed']} failed")
+        return {**self.stats, "failures": failures}
+
+    def swap_pair(self, session: requests.Session, target_path: str, source_path: str, final_path: str) -> str:
+        """ 한 쌍을 요청하여 final_path에 저장합니다. 성공 응답이 아니거나 이미지가 아니면 예외를 냅니다 """
+        # API에 전송할 JSON 데이터
+        data = {
+            "source_img": self.image_file_to_base64(target_path),
+            "target_img": self.image_file_to_base64(source_path),
+            "input_faces_index": 0,
+            "source_faces_index": 0,
+            "face_restore": "codeformer-v0.1.0.pth",
+            "image_quality": 100,
+            "base64": False
+        }
+
+        # API 요청 (연결 재사용, 재시도 포함)
+        response = request_with_retry(session, "POST", self.url, retries=self.retries, backoff=self.backoff,
+                                      timeout=self.timeout, rate_limiter=self.bucket, json=data)
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+        try:
+            with Image.open(io.BytesIO(response.content)) as img:
+                img.verify()
+        except Exception:
+            raise RuntimeError(f"Response is not an image: {response.content[:200]!r}")
+
+        # 이미지 저장 (임시 파일에 쓴 뒤 교체하여, 중단되어도 반쯤 쓰인 결과가 남지 않게 합니다)
+        tmp_path = f"{final_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(tmp_path, final_path)
+        return final_path
 
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
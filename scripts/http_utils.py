@@ -0,0 +1,108 @@
+import contextlib
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(headers : dict = None, pool_size : int = 10) -> requests.Session:
+    """
+    keep-alive 연결을 재사용하는 requests.Session을 만듭니다 (스레드끼리 공유해도 됩니다)
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    if headers:
+        session.headers.update(headers)
+    return session
+
+
+def request_with_retry(session : requests.Session, method : str, url : str,
+                       retries : int = 3, backoff : float = 0.5, timeout=(5, 30),
+                       retry_status : set = RETRY_STATUS, rate_limiter=None, slot=None, **kwargs) -> requests.Response:
+    """
+    연결 오류, 타임아웃, retry_status 응답에 대해 지수 백오프로 재시도합니다.
+    rate_limiter(TokenBucket 등)를 주면 매 시도 전에 acquire()합니다.
+    slot(HostLimiter의 세마포어 등)을 주면 시도하는 동안에만 잡고, 백오프 / Retry-After 대기 중에는 놓습니다.
+    재시도마다 요청 본문을 다시 보내므로 files/data에는 파일 객체 대신 bytes를 넘겨주세요.
+    마지막 시도의 응답은 상태 코드와 관계없이 그대로 반환합니다.
+    """
+    for attempt in range(retries + 1):
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with slot if slot is not None else contextlib.nullcontext():
+                response = session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+            delay = backoff * (2 ** attempt)
+        else:
+            if response.status_code not in retry_status or attempt == retries:
+                return response
+            delay = retry_after(response, backoff * (2 ** attempt))
+            response.close()
+        time.sleep(delay)
+
+
+def retry_after(response : requests.Response, default : float) -> float:
+    """ Retry-After 헤더(초 단위)가 있으면 그 값을, 없으면 default를 반환합니다 """
+    try:
+        return max(float(response.headers.get("Retry-After", default)), 0.0)
+    except ValueError:
+        return default
+
+
+class HostLimiter():
+    """
+    호스트별 동시 요청 수를 제한합니다.
+
+        with limiter(url):
+            session.get(url)
+    """
+
+    def __init__(self, per_host : int = 4):
+        self.per_host = per_host
+        self._lock = threading.Lock()
+        self._semaphores = {}
+
+    def __call__(self, url : str) -> threading.Semaphore:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host)
+            return self._semaphores[host]
+
+
+class TokenBucket():
+    """
+    초당 rate개의 토큰이 쌓이는 버킷 (최대 capacity개). acquire()는 토큰이 생길 때까지 기다립니다.
+    여러 스레드가 공유하여 API의 QPS 제한을 맞출 때 씁니다.
+    """
+
+    def __init__(self, rate : float, capacity : float = 1.0):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens : float = 1.0) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
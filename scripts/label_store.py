@@ -0,0 +1,155 @@
+import glob
+import json
+import os
+import threading
+
+
+class JsonlStore():
+    """
+    레코드를 한 줄에 하나씩 JSON으로 이어 쓰는 파일 하나와, 메모리의 {key: 레코드} 인덱스.
+    - put()은 파일 끝에 한 줄을 붙이기만 하므로, 중간에 멈춰도 그때까지 받은 레코드는 남습니다
+    - 같은 key가 여러 번 나오면 마지막 줄이 이깁니다. compact()로 최신 레코드만 남겨 다시 씁니다
+    - 중단으로 반쯤 쓰인 마지막 줄은 읽을 때 건너뜁니다
+    """
+
+    def __init__(self, path : str, key : str):
+        self.path = path
+        self.key = key
+        self.records = {}
+        self._lock = threading.Lock()
+        self._stale_lines = 0 # 덮어써졌거나 깨진 줄 수 (compact 대상)
+        self._needs_newline = False
+        self.load()
+
+    def load(self) -> None:
+        self.records = {}
+        self._stale_lines = 0
+        self._needs_newline = False
+        if not os.path.isfile(self.path):
+            return
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                self._needs_newline = not line.endswith("\n")
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self._stale_lines += 1
+                    continue
+                if record[self.key] in self.records:
+                    self._stale_lines += 1
+                self.records[record[self.key]] = record
+
+    def __contains__(self, key) -> bool:
+        return key in self.records
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, key, default=None):
+        return self.records.get(key, default)
+
+    def keys(self) -> list:
+        return list(self.records)
+
+    def values(self) -> list:
+        return list(self.records.values())
+
+    def put(self, record : dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(("\n" if self._needs_newline else "") + line + "\n")
+            self._needs_newline = False
+            if record[self.key] in self.records:
+                self._stale_lines += 1
+            self.records[record[self.key]] = record
+
+    def rewrite(self, records : list) -> None:
+        """ 파일을 records만으로 새로 씁니다 (임시 파일에 쓴 뒤 교체) """
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            os.replace(tmp_path, self.path)
+            self.records = {record[self.key]: record for record in records}
+            self._stale_lines = 0
+            self._needs_newline = False
+
+    def compact(self, keep=None) -> None:
+        """ 최신 레코드만 남깁니다. keep(key 모음)을 주면 그 밖의 레코드는 지웁니다 """
+        records = [record for key, record in self.records.items() if keep is None or key in keep]
+        if self._stale_lines or len(records) != len(self.records):
+            self.rewrite(records)
+
+    def clear(self) -> None:
+        self.rewrite([])
+
+
+class LabelStore(JsonlStore):
+    """
+    에피소드 한 편의 얼굴 라벨을 dataset/<에피소드>/labels.jsonl 하나에 모읍니다 (컷마다 .js / .json 파일을 만들지 않습니다).
+    한 줄 = {"panel": 컷 이름, "sha1": 라벨을 만들 때의 컷 sha1, "detector": 라벨 생성 백엔드, "label": 검출기 응답}
+    라벨러(label_episode)는 put()으로 덧붙이고, 크롭 단계는 faces(컷 이름)로 조회합니다.
+    """
+    FILE_NAME = "labels.jsonl"
+    ERRORS_NAME = "label_errors.jsonl" # 얼굴 검출 결과가 아닌 응답(예: INVALID_IMAGE_SIZE). 라벨로 저장하지 않습니다
+    LEGACY_DIREC = "label"
+
+    def __init__(self, dataset_ep_direc : str):
+        self.dataset_ep_direc = dataset_ep_direc
+        super().__init__(os.path.join(dataset_ep_direc, self.FILE_NAME), key="panel")
+        if not self.records:
+            self.import_legacy()
+
+    def add(self, panel : str, sha1 : str, detector : str, label : dict) -> None:
+        self.put({"panel": panel, "sha1": sha1, "detector": detector, "label": label})
+
+    def errors(self) -> JsonlStore:
+        """ 라벨을 받지 못한 컷의 오류 응답 저장소 ({"panel", "sha1", "detector", "error"}) """
+        return JsonlStore(os.path.join(self.dataset_ep_direc, self.ERRORS_NAME), key="panel")
+
+    def faces(self, panel : str):
+        """ 컷의 얼굴 리스트. 라벨이 없는 컷이면 None """
+        record = self.records.get(panel)
+        if record is None:
+            return None
+        return record["label"].get("faces", [])
+
+    def import_legacy(self) -> int:
+        """
+        예전 방식의 dataset/<에피소드>/label/<컷>.js (또는 .json) 라벨을 한 번 옮겨옵니다.
+        어느 컷 sha1로 만든 라벨인지는 manifest.json의 예전 labels 기록에서 가져옵니다 (없으면 None이라 다시 요청됩니다).
+        """
+        legacy_direc = os.path.join(self.dataset_ep_direc, self.LEGACY_DIREC)
+        paths = sorted(glob.glob(os.path.join(legacy_direc, "*.js")) + glob.glob(os.path.join(legacy_direc, "*.json")))
+        if not paths:
+            return 0
+
+        try:
+            with open(os.path.join(self.dataset_ep_direc, "manifest.json"), "r", encoding="utf-8") as f:
+                legacy_labels = json.load(f).get("labels", {})
+        except (FileNotFoundError, json.JSONDecodeError):
+            legacy_labels = {}
+
+        records = {}
+        for path in paths:
+            stem = os.path.splitext(os.path.basename(path))[0]
+            if not stem.isdigit(): # 컷 라벨이 아닌 파일 (sorted_slices와 같이 숫자 이름만)
+                continue
+            panel = f"{stem}.png"
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    label = json.load(f)
+            except json.JSONDecodeError:
+                continue
+            entry = legacy_labels.get(panel, {})
+            records[panel] = {"panel": panel, "sha1": entry.get("sha1"), "detector": entry.get("detector", "facepp"), "label": label}
+
+        self.rewrite(sorted(records.values(), key=lambda record: int(os.path.splitext(record["panel"])[0])))
+        return len(records)
@@ -0,0 +1,139 @@
+import io
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from facepp import FaceDetector
+
+try:
+    import dlib
+except ImportError:
+    dlib = None
+
+
+# dlib 68점 -> Face++ landmark 이름 (naive_face_crop이 쓰는 윤곽 / 눈썹 외에 눈, 코, 입 주요 점도 채웁니다)
+# "left"는 이미지의 왼쪽을 뜻합니다
+EYEBROW_KEYS = ["left_corner", "upper_left_quarter", "upper_middle", "upper_right_quarter", "right_corner"]
+EYE_KEYS = {"left_corner": [0], "upper_left_quarter": [1], "top": [1, 2], "upper_right_quarter": [2],
+            "right_corner": [3], "lower_right_quarter": [4], "bottom": [4, 5], "lower_left_quarter": [5],
+            "center": [0, 1, 2, 3, 4, 5]}
+NOSE_KEYS = {"nose_tip": 30, "nose_left": 31, "nose_contour_lower_middle": 33, "nose_right": 35}
+MOUTH_KEYS = {"mouth_left_corner": 48, "mouth_upper_lip_top": 51, "mouth_right_corner": 54,
+              "mouth_lower_lip_bottom": 57, "mouth_upper_lip_bottom": 62, "mouth_lower_lip_top": 66}
+
+
+def _point(xy) -> dict:
+    return {"x": int(round(float(xy[0]))), "y": int(round(float(xy[1])))}
+
+
+def dlib_to_facepp_landmark(points : np.ndarray) -> dict:
+    """
+    (68, 2) dlib 랜드마크를 Face++ landmark dict로 변환합니다.
+    턱선 17점은 Face++ 윤곽 19점(contour_left1~9, contour_chin, contour_right9~1)에 맞게 선형 보간합니다.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    landmark = {}
+
+    jaw = points[0:17]
+    t = np.linspace(0, 16, 19)
+    contour = np.stack([np.interp(t, np.arange(17), jaw[:, 0]), np.interp(t, np.arange(17), jaw[:, 1])], axis=1)
+    for i in range(1, 10):
+        landmark[f"contour_left{i}"] = _point(contour[i - 1])
+        landmark[f"contour_right{i}"] = _point(contour[19 - i])
+    landmark["contour_chin"] = _point(contour[9])
+
+    for side, brow, eye in (("left", points[17:22], points[36:42]), ("right", points[22:27], points[42:48])):
+        for key, xy in zip(EYEBROW_KEYS, brow):
+            landmark[f"{side}_eyebrow_{key}"] = _point(xy)
+        for key, idx in EYE_KEYS.items():
+            landmark[f"{side}_eye_{key}"] = _point(eye[idx].mean(axis=0))
+
+    for key, idx in {**NOSE_KEYS, **MOUTH_KEYS}.items():
+        landmark[key] = _point(points[idx])
+
+    return landmark
+
+
+def detect_faces(img : np.ndarray, detector, predictor, upsample : int = 1) -> dict:
+    """
+    RGB 배열에서 얼굴을 찾아 Face++ detect 응답과 같은 형식의 dict를 반환합니다
+    (attributes는 계산하지 않습니다)
+    """
+    start = time.perf_counter()
+    faces = []
+    for rect in detector(img, upsample):
+        shape = predictor(img, rect)
+        points = np.array([[p.x, p.y] for p in shape.parts()])
+        faces.append({
+            "face_token": uuid.uuid4().hex,
+            "face_rectangle": {"top": max(rect.top(), 0), "left": max(rect.left(), 0),
+                               "width": rect.width(), "height": rect.height()},
+            "landmark": dlib_to_facepp_landmark(points),
+        })
+
+    return {
+        "request_id": f"local,{uuid.uuid4()}",
+        "time_used": int((time.perf_counter() - start) * 1000),
+        "faces": faces,
+        "image_id": uuid.uuid4().hex,
+        "face_num": len(faces),
+    }
+
+
+# 워커 프로세스마다 한 번만 모델을 읽습니다
+_models = {}
+
+
+def _load_models(predictor_path : str) -> tuple:
+    if predictor_path not in _models:
+        _models[predictor_path] = (dlib.get_frontal_face_detector(), dlib.shape_predictor(predictor_path))
+    return _models[predictor_path]
+
+
+def _detect_bytes(image_bytes : bytes, predictor_path : str, upsample : int) -> dict:
+    detector, predictor = _load_models(predictor_path)
+    img = np.asarray(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+    return detect_faces(img, detector, predictor, upsample)
+
+
+def _detect_array(panel : np.ndarray, predictor_path : str, upsample : int) -> dict:
+    detector, predictor = _load_models(predictor_path)
+    return detect_faces(np.ascontiguousarray(panel), detector, predictor, upsample)
+
+
+def _detect_file(image_path : str, predictor_path : str, upsample : int) -> dict:
+    with open(image_path, "rb") as f:
+        return _detect_bytes(f.read(), predictor_path, upsample)
+
+
+class LocalLandmarkDetector(FaceDetector):
+    """
+    JoJoGAN/util.py와 같은 dlib 얼굴 검출기 + 68점 predictor로 네트워크 없이 라벨을 만듭니다.
+    컷은 프로세스 풀(workers개)에서 병렬로 처리하고, 결과는 Face++와 같은 JSON 형식입니다.
+    """
+
+    def __init__(self, predictor_path : str, workers : int = None, upsample : int = 1):
+        if dlib is None:
+            raise ImportError("dlib이 필요합니다. 'pip install dlib' 명령어로 설치하세요.")
+        if not os.path.isfile(predictor_path):
+            raise FileNotFoundError(f"dlib shape predictor not found: {predictor_path}")
+
+        self.predictor_path = predictor_path
+        self.upsample = upsample
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def detect(self, image_bytes : bytes) -> dict:
+        return _detect_bytes(image_bytes, self.predictor_path, self.upsample)
+
+    def submit(self, image_path : str):
+        return self.executor.submit(_detect_file, image_path, self.predictor_path, self.upsample)
+
+    def submit_array(self, panel : np.ndarray):
+        return self.executor.submit(_detect_array, np.asarray(panel), self.predictor_path, self.upsample)
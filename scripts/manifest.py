@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def load_json(path : str, default=None):
+    """ JSON 파일을 읽습니다. 없거나 깨진 파일이면 default를 반환합니다 """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+
+def write_json_atomic(path : str, obj) -> None:
+    """
+    임시 파일에 쓴 뒤 교체하여, 중간에 중단되어도 반쯤 쓰인 JSON이 남지 않게 합니다.
+    임시 파일 이름은 쓸 때마다 달라서, 여러 스레드 / 프로세스가 같은 파일을 동시에 써도 서로의 임시 파일을 덮어쓰지 않습니다 (마지막 교체가 이깁니다).
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp", dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def file_sha1(path : str, chunk_size : int = 1 << 20) -> str:
+    """ 파일 내용의 sha1 해시 """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadManifest():
+    """
+    rawdata/<에피소드>/manifest.json 에 다운로드가 끝난 이미지를 기록합니다.
+    중단된 크롤링을 다시 시작하면 기록된 이미지는 건너뜁니다.
+    """
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, episode_direc : str):
+        self.episode_direc = episode_direc
+        self.path = os.path.join(episode_direc, self.FILE_NAME)
+        self._lock = threading.Lock()
+
+        data = load_json(self.path, default={})
+        self.episode_link = data.get("episode_link")
+        self.complete = data.get("complete", False)
+        self.images = data.get("images", {})
+
+    def is_done(self, idx : int, url : str, img_path : str) -> bool:
+        entry = self.images.get(str(idx))
+        if entry is None or entry["url"] != url:
+            return False
+        return os.path.isfile(img_path) and os.path.getsize(img_path) == entry["bytes"]
+
+    def mark_done(self, idx : int, url : str, num_bytes : int) -> None:
+        with self._lock:
+            self.images[str(idx)] = {"url": url, "bytes": num_bytes}
+            self.save()
+
+    def mark_complete(self, episode_link : str) -> None:
+        with self._lock:
+            self.episode_link = episode_link
+            self.complete = True
+            self.save()
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {
+            "episode_link": self.episode_link,
+            "complete": self.complete,
+            "images": self.images,
+        })
+
+
+class CrawlState():
+    """
+    <project>/crawl_state.json 에 웹툰별 크롤링 상태를 저장합니다.
+    - last_data_no : 이 번호 이하의 무료 회차는 모두 받은 상태
+    - list_url_prefix : 리스트 페이지 주소 (다음 실행에서 검색 페이지 요청을 생략)
+    - validators : 리스트 페이지별 ETag / Last-Modified
+    """
+    FILE_NAME = "crawl_state.json"
+
+    def __init__(self, project_direc : str, title : str):
+        self.path = os.path.join(project_direc, self.FILE_NAME)
+        self.title = title
+
+        data = load_json(self.path, default={})
+        if data.get("title") != title: # 다른 웹툰의 상태는 쓰지 않습니다
+            data = {}
+
+        self.last_data_no = data.get("last_data_no")
+        self.list_url_prefix = data.get("list_url_prefix")
+        self.validators = data.get("validators", {})
+
+    def conditional_headers(self, url : str) -> dict:
+        validator = self.validators.get(url, {})
+        headers = {}
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+        return headers
+
+    def remember_validators(self, url : str, response) -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            self.validators[url] = {"etag": etag, "last_modified": last_modified}
+
+    def advance(self, episodes : list, failed : set) -> None:
+        """
+        episodes : [(제목, url, data_no), ...] 중 failed에 없는 회차까지 last_data_no를 올립니다.
+        실패한 회차가 있으면 그 회차부터 다시 받을 수 있도록 그 직전 번호에서 멈춥니다.
+        """
+        data_nos = [data_no for _, _, data_no in episodes]
+        failed_nos = [data_no for title, _, data_no in episodes if title in failed]
+        if failed_nos:
+            self.validators = {} # 리스트가 그대로여도 다음 실행에서 다시 훑어야 합니다
+            new_last = min(failed_nos) - 1
+        elif data_nos:
+            new_last = max(data_nos)
+        else:
+            return
+        self.last_data_no = max(new_last, self.last_data_no or 0)
+
+    def save(self) -> None:
+        write_json_atomic(self.path, {
+            "title": self.title,
+            "last_data_no": self.last_data_no,
+            "list_url_prefix": self.list_url_prefix,
+            "validators": self.validators,
+        })
+
+
+class EpisodeManifest():
+    """
+    dataset/<에피소드>/manifest.json 에 전처리 입력과 결과를 기록합니다.
+    - inputs : {조각 이미지 이름: sha1}
+    - panels : {컷 파일 이름: {"sha1": 픽셀 해시, "blank": bool}} (빈칸인 컷은 파일로 저장하지 않습니다)
+    얼굴 라벨은 dataset/<에피소드>/labels.jsonl (label_store.LabelStore)에 컷 sha1과 함께 모입니다.
+    조각 이미지가 그대로면 컷 나누기를, 컷이 그대로면 라벨 요청을 건너뜁니다.
+    """
+    FILE_NAME = "manifest.json"
+
+    def __init__(self, dataset_ep_direc : str):
+        self.path = os.path.join(dataset_ep_direc, self.FILE_NAME)
+
+        data = load_json(self.path, default={})
+        self.inputs = data.get("inputs", {})
+        self.panels = data.get("panels", {})
+        # 예전 방식(컷마다 라벨 파일)의 기록. LabelStore가 옮겨갈 때까지만 그대로 보존합니다
+        self.legacy_labels = data.get("labels", {})
+
+    def is_dissected(self, inputs : dict, store, split_img_direc : str = None) -> bool:
+        """ 입력이 같고, 패널 인덱스(store)와 (split_img_direc를 주면) 컷 PNG가 모두 남아있는지 확인합니다 """
+        if not self.panels or inputs != self.inputs:
+            return False
+        if not store.exists() or store.content_panels() != self.content_panels():
+            return False
+        if split_img_direc is not None:
+            return all(os.path.isfile(os.path.join(split_img_direc, panel)) for panel in self.content_panels())
+        return True
+
+    def content_panels(self) -> list:
+        return sorted((panel for panel, info in self.panels.items() if not info["blank"]),
+                      key=lambda x: int(os.path.splitext(x)[0]))
+
+    def label_is_fresh(self, panel : str, labels, detector : str = "facepp") -> bool:
+        """
+        labels(LabelStore)에 지금 컷 내용과 같은 sha1, 같은 백엔드로 만든 라벨이 있는지 확인합니다.
+        예전에 라벨로 저장된 오류 응답("faces"가 없는 응답)은 라벨로 치지 않습니다.
+        """
+        record = labels.get(panel)
+        if record is None or panel not in self.panels or record["sha1"] != self.panels[panel]["sha1"]:
+            return False
+        if "faces" not in record["label"]:
+            return False
+        return record.get("detector", "facepp") == detector
+
+    def prune_labels(self, labels) -> None:
+        """ 더 이상 존재하지 않는 컷의 라벨을 지우고, 덮어써진 줄을 정리합니다 """
+        labels.compact(keep=self.panels)
+
+    def save(self) -> None:
+        data = {"inputs": self.inputs, "panels": self.panels}
+        if self.legacy_labels:
+            data["labels"] = self.legacy_labels
+        write_json_atomic(self.path, data)
+
+
+class ContentCache():
+    """
+    API 응답을 내용 해시(key)로 저장하는 디스크 캐시 (<cache_direc>/<key 앞 2자리>/<key>.json)
+    key는 보통 요청한 이미지 바이트의 sha1 (ContentCache.key) 또는 컷의 픽셀 sha1입니다.
+    """
+
+    def __init__(self, cache_direc : str):
+        self.cache_direc = cache_direc
+
+    @staticmethod
+    def key(content : bytes) -> str:
+        return hashlib.sha1(content).hexdigest()
+
+    def path(self, key : str) -> str:
+        return os.path.join(self.cache_direc, key[:2], f"{key}.json")
+
+    def get(self, key : str):
+        return load_json(self.path(key))
+
+    def put(self, key : str, obj) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_json_atomic(path, obj)
@@ -0,0 +1,181 @@
+import io
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from PIL import Image
+
+from http_utils import TokenBucket, make_session, request_with_retry
+from manifest import ContentCache
+
+
+class UpstageOCRClient():
+    """
+    Upstage document OCR API 클라이언트.
+    - 스레드 풀로 최대 max_in_flight개의 요청을 동시에 보내되, 토큰 버킷으로 초당 qps개를 넘지 않게 합니다
+    - 연결 오류, 429, 5xx 응답은 지수 백오프로 재시도합니다 (Retry-After 헤더를 따릅니다)
+    - 원본 OCR 응답을 cache_direc에 업로드한 이미지 내용의 sha1로 저장합니다.
+      target_words 매칭은 응답을 받은 뒤에 하므로, 타겟 단어를 바꿔 다시 돌려도 업로드하지 않습니다
+    - submit_batch는 여러 컷을 다중 페이지 문서 한 장으로 묶어 한 번에 요청하고, 응답의 pages를 컷별 결과로 나눕니다
+    - 업로드 전에 긴 변이 max_side를 넘는 컷은 줄이고 upload_format으로 인코딩하며, 응답 좌표는 원본 컷 픽셀 좌표로 되돌립니다
+      PNG : 한 장은 PNG, 여러 장은 무손실 TIFF / JPEG, WEBP : 한 장은 해당 포맷, 여러 장은 JPEG 페이지의 PDF (quality 적용)
+    """
+    API_URL = "https://api.upstage.ai/v1/document-ai/ocr"
+    UPLOAD_FORMATS = ("PNG", "JPEG", "WEBP")
+
+    def __init__(self, api_key : str, cache_direc : str = None, api_url : str = API_URL,
+                 qps : float = 1.0, max_in_flight : int = 4, retries : int = 5, backoff : float = 1.0, timeout=(5, 60),
+                 max_side : int = None, upload_format : str = "PNG", quality : int = 90):
+        if upload_format not in self.UPLOAD_FORMATS:
+            raise ValueError(f"upload_format must be one of {self.UPLOAD_FORMATS}, got {upload_format}")
+        self.api_url = api_url
+        self.cache = ContentCache(cache_direc) if cache_direc is not None else None
+        self.max_side = max_side
+        self.upload_format = upload_format
+        self.quality = quality
+
+        self.session = make_session({"Authorization": f"Bearer {api_key}"}, pool_size=max_in_flight)
+        self.bucket = TokenBucket(qps) # 버스트 없이 일정한 간격으로 보냅니다
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.stats = {"uploads": 0, "pages": 0, "bytes": 0, "cache_hits": 0}
+        self._stats_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def submit_batch(self, items : list):
+        """
+        items : [(캐시 키, 컷 RGB 배열을 반환하는 함수), ...]
+        recognize_batch를 스레드 풀에 넣고 Future를 반환합니다 (컷 로딩과 인코딩도 풀에서 진행합니다)
+        """
+        return self.executor.submit(self.recognize_batch, items)
+
+    def recognize_batch(self, items : list) -> list:
+        """
+        캐시에 없는 컷만 다중 페이지 문서 한 장으로 묶어 요청하고, items 순서대로 컷별 응답 {"pages": [page]}의 리스트를 반환합니다.
+        페이지 좌표는 각 컷의 (줄이기 전) 픽셀 좌표로 맞춥니다.
+        """
+        results = [None] * len(items)
+        pending = []
+        for i, (key, _) in enumerate(items):
+            cached = self.cache.get(self.cache_key(key)) if self.cache is not None else None
+            if cached is not None:
+                self._count("cache_hits")
+                results[i] = cached
+            else:
+                pending.append(i)
+
+        if not pending:
+            return results
+
+        panels = [items[i][1]() for i in pending]
+        uploads = [prepare_upload(panel, self.max_side) for panel in panels]
+        document, file_name = self.encode_document(uploads)
+        response = self._post(document, file_name, len(panels))
+        pages = sorted(response.get("pages", []), key=lambda page: page.get("id", 0))
+        if len(pages) != len(panels):
+            raise ValueError(f"OCR returned {len(pages)} pages for {len(panels)} panels")
+
+        for i, panel, upload, page in zip(pending, panels, uploads, pages):
+            results[i] = {"pages": [remap_page(page, panel.shape[1], panel.shape[0], upload.width, upload.height)]}
+            if self.cache is not None:
+                self.cache.put(self.cache_key(items[i][0]), results[i])
+        return results
+
+    def cache_key(self, key : str) -> str:
+        """ 업로드 설정이 바뀌면 (인식 품질이 달라지므로) 다른 캐시 항목을 씁니다 """
+        if self.max_side is None and self.upload_format == "PNG":
+            return key
+        return ContentCache.key(f"{key}:{self.upload_format}:{self.max_side}:{self.quality}".encode())
+
+    def encode_document(self, uploads : list) -> tuple:
+        """ 업로드할 (문서 바이트, 파일 이름) """
+        if len(uploads) == 1:
+            extension = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}[self.upload_format]
+            return encode_image(uploads[0], self.upload_format, self.quality), f"panel.{extension}"
+        if self.upload_format == "PNG":
+            return encode_pages(uploads, "TIFF"), "panels.tiff"
+        return encode_pages(uploads, "PDF", self.quality), "panels.pdf"
+
+    def _post(self, document : bytes, file_name : str, num_pages : int) -> dict:
+        with self._stats_lock:
+            self.stats["uploads"] += 1
+            self.stats["pages"] += num_pages
+            self.stats["bytes"] += len(document)
+        response = request_with_retry(self.session, "POST", self.api_url, retries=self.retries, backoff=self.backoff,
+                                      timeout=self.timeout, rate_limiter=self.bucket,
+                                      files={"document": (file_name, document)})
+        response.raise_for_status()
+        try:
+            return response.json()
+        except json.JSONDecodeError:
+            raise requests.HTTPError(f"Failed to decode OCR response: {response.text[:200]}", response=response)
+
+    def _count(self, key : str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+
+def prepare_upload(panel : np.ndarray, max_side : int = None) -> Image.Image:
+    """ 긴 변이 max_side보다 길면 비율을 유지하여 줄인 PIL 이미지 """
+    image = Image.fromarray(np.ascontiguousarray(panel))
+    if max_side is not None and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.LANCZOS)
+    return image
+
+
+def encode_image(image : Image.Image, format : str, quality : int = 90) -> bytes:
+    buffer = io.BytesIO()
+    if format == "PNG":
+        image.save(buffer, format="PNG")
+    else:
+        image.save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_pages(images : list, format : str = "TIFF", quality : int = 90) -> bytes:
+    """
+    한 페이지에 한 장씩 담은 다중 페이지 문서로 인코딩합니다.
+    TIFF : 무손실 deflate 압축 / PDF : 각 페이지를 quality의 JPEG로 담고, 1 pt = 1 px (72 dpi)
+    """
+    buffer = io.BytesIO()
+    if format == "TIFF":
+        images[0].save(buffer, format="TIFF", save_all=True, append_images=images[1:], compression="tiff_deflate")
+    else:
+        images[0].save(buffer, format="PDF", save_all=True, append_images=images[1:], resolution=72, quality=quality)
+    return buffer.getvalue()
+
+
+def remap_page(page : dict, width : int, height : int, upload_width : int = None, upload_height : int = None) -> dict:
+    """
+    단어 boundingBox.vertices를 원본 컷(width x height) 픽셀 좌표로 변환합니다.
+    좌표계의 크기는 응답 페이지의 width / height를 따르고, 없으면 업로드한 이미지 크기로 봅니다.
+    """
+    page_width = page.get("width") or upload_width or width
+    page_height = page.get("height") or upload_height or height
+    if (page_width, page_height) == (width, height):
+        return page
+
+    scale_x, scale_y = width / page_width, height / page_height
+    words = []
+    for word in page.get("words", []):
+        vertices = word.get("boundingBox", {}).get("vertices", [])
+        vertices = [{"x": int(round(pt.get("x", 0) * scale_x)), "y": int(round(pt.get("y", 0) * scale_y))} for pt in vertices]
+        words.append({**word, "boundingBox": {**word.get("boundingBox", {}), "vertices": vertices}})
+    return {**page, "width": width, "height": height, "words": words}
@@ -0,0 +1,169 @@
+import glob
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from manifest import file_sha1, load_json, write_json_atomic
+
+
+class PanelStore():
+    """
+    에피소드 한 편의 컷을 PNG 파일 대신 하나의 픽셀 저장소와 인덱스로 보관합니다.
+    - dataset/<에피소드>/panels.bin  : 빈칸이 아닌 컷의 RGB 행을 순서대로 이어붙인 raw uint8 (memmap으로 읽음)
+    - dataset/<에피소드>/panels.json : {"width", "rows", "panels": {컷 이름: {"top", "height", "offset", "blank", "sha1"}}}
+      top은 에피소드 스트립에서의 시작 행, offset은 panels.bin에서의 시작 행입니다 (빈칸은 None)
+    panel() / region()은 memmap의 읽기 전용 view를 반환하므로 복사나 디코딩이 없습니다.
+    """
+    INDEX_NAME = "panels.json"
+    PIXELS_NAME = "panels.bin"
+
+    def __init__(self, episode_direc : str):
+        self.episode_direc = episode_direc
+        self.index_path = os.path.join(episode_direc, self.INDEX_NAME)
+        self.pixels_path = os.path.join(episode_direc, self.PIXELS_NAME)
+
+        index = load_json(self.index_path, default={})
+        self.width = index.get("width")
+        self.rows = index.get("rows", 0)
+        self.panels = index.get("panels", {})
+
+        self._pixels = None
+        self._file = None
+
+    def exists(self) -> bool:
+        return os.path.isfile(self.index_path) and os.path.isfile(self.pixels_path)
+
+    # ---------------------------------------------------------------- 쓰기
+    def create(self) -> None:
+        """ 기존 저장소를 새로 씁니다. append()로 컷을 넣고 finish()로 마무리합니다 """
+        self.width = None
+        self.rows = 0
+        self.panels = {}
+        self._pixels = None
+        self._file = open(f"{self.pixels_path}.tmp", "wb")
+
+    def append(self, name : str, top : int, panel : np.ndarray, blank : bool, sha1 : str) -> None:
+        height, width = panel.shape[:2]
+        entry = {"top": int(top), "height": int(height), "offset": None, "blank": bool(blank), "sha1": sha1}
+
+        if not blank:
+            if self.width is None:
+                self.width = int(width)
+            elif width != self.width:
+                raise ValueError(f"Panel {name} has width {width}, expected {self.width}")
+            entry["offset"] = self.rows
+            self._file.write(np.ascontiguousarray(panel, dtype=np.uint8).data)
+            self.rows += int(height)
+
+        self.panels[name] = entry
+
+    def finish(self) -> None:
+        self._file.close()
+        self._file = None
+        os.replace(f"{self.pixels_path}.tmp", self.pixels_path)
+        write_json_atomic(self.index_path, {"width": self.width, "rows": self.rows, "panels": self.panels})
+
+    # ---------------------------------------------------------------- 읽기
+    def pixels(self) -> np.ndarray:
+        if self._pixels is None:
+            if self.rows == 0:
+                self._pixels = np.zeros((0, self.width or 0, 3), dtype=np.uint8)
+            else:
+                self._pixels = np.memmap(self.pixels_path, dtype=np.uint8, mode="r", shape=(self.rows, self.width, 3))
+        return self._pixels
+
+    def content_panels(self) -> list:
+        return sorted((name for name, entry in self.panels.items() if not entry["blank"]),
+                      key=lambda x: int(os.path.splitext(x)[0]))
+
+    def panel(self, name : str) -> np.ndarray:
+        """ 컷 전체의 (height, width, 3) RGB view """
+        entry = self.panels[name]
+        if entry["blank"]:
+            raise KeyError(f"Panel {name} is blank and has no pixels")
+        return self.pixels()[entry["offset"]:entry["offset"] + entry["height"]]
+
+    def region(self, name : str, left : int, top : int, right : int, bottom : int) -> np.ndarray:
+        """ 컷 좌표계의 (left, top, right, bottom) 영역 view (PIL crop과 같은 규칙) """
+        return self.panel(name)[max(top, 0):max(bottom, 0), max(left, 0):max(right, 0)]
+
+
+class PanelSource():
+    """
+    컷을 읽는 곳을 하나로 묶습니다. panels.json이 있으면 PanelStore에서,
+    없으면 (예전 방식으로 만든 데이터셋) img 폴더의 PNG 파일에서 읽습니다.
+
+    PNG에서 디코딩한 배열은 cache_bytes 바이트까지 LRU로 보관하여, 같은 컷을 여러 단계에서 읽어도 한 번만 디코딩합니다.
+    PanelStore의 컷은 memmap view라 디코딩이 없으므로 캐시하지 않습니다. 여러 스레드에서 불러도 됩니다.
+    """
+    DECODE_LOCKS = 64
+
+    def __init__(self, episode_direc : str, cache_bytes : int = 0):
+        self.store = PanelStore(episode_direc)
+        self.img_direc = os.path.join(episode_direc, "img")
+        self.use_store = self.store.exists()
+
+        self.cache_bytes = cache_bytes
+        self.stats = {"decodes": 0, "cache_hits": 0, "evictions": 0}
+        self._cache = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        # 컷 이름의 해시로 고르는 고정 개수의 잠금 (컷마다 잠금을 만들지 않아 컷 수와 상관없이 크기가 일정합니다)
+        self._decode_locks = tuple(threading.Lock() for _ in range(self.DECODE_LOCKS))
+
+    def names(self) -> list:
+        if self.use_store:
+            return self.store.content_panels()
+        paths = [p for ext in ["*.jpg", "*.png"] for p in glob.glob(os.path.join(self.img_direc, ext))]
+        return sorted(os.path.basename(p) for p in paths)
+
+    def load(self, name : str) -> np.ndarray:
+        """ RGB 배열 (읽기 전용. PanelStore면 view, PNG면 캐시된 디코딩 결과) """
+        if self.use_store:
+            return self.store.panel(name)
+
+        decode_lock = self._decode_locks[hash(name) % len(self._decode_locks)]
+        with decode_lock: # 같은 컷을 여러 스레드가 동시에 디코딩하지 않게 합니다
+            with self._lock:
+                if name in self._cache:
+                    self._cache.move_to_end(name)
+                    self.stats["cache_hits"] += 1
+                    return self._cache[name]
+
+            with Image.open(os.path.join(self.img_direc, name)) as img:
+                panel = np.asarray(img.convert("RGB"))
+            panel.flags.writeable = False
+
+            with self._lock:
+                self.stats["decodes"] += 1
+                if panel.nbytes <= self.cache_bytes:
+                    self._cache[name] = panel
+                    self._cached_bytes += panel.nbytes
+                    while self._cached_bytes > self.cache_bytes:
+                        _, evicted = self._cache.popitem(last=False)
+                        self._cached_bytes -= evicted.nbytes
+                        self.stats["evictions"] += 1
+            return panel
+
+    def sha1(self, name : str) -> str:
+        """ 컷 내용의 해시 (PanelStore의 픽셀 sha1, PNG 파일이면 파일 sha1) """
+        if self.use_store:
+            return self.store.panels[name]["sha1"]
+        return file_sha1(os.path.join(self.img_direc, name))
+
+    def encode(self, name : str, format : str = "PNG") -> bytes:
+        """ API 업로드용 인코딩 바이트 (PNG 파일이 있으면 다시 인코딩하지 않고 그대로 읽습니다) """
+        if not self.use_store:
+            with open(os.path.join(self.img_direc, name), "rb") as f:
+                return f.read()
+        return encode_array(self.store.panel(name), format)
+
+
+def encode_array(panel : np.ndarray, format : str = "PNG", **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(panel)).save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import time
+
+from manifest import load_json, write_json_atomic
+
+
+def path_fingerprint(path : str):
+    """ 파일은 (크기, 수정 시각), 폴더는 그 안의 파일 목록과 각 파일의 (크기, 수정 시각). 없으면 None """
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    if os.path.isdir(path):
+        return {name: path_fingerprint(os.path.join(path, name)) for name in sorted(os.listdir(path))}
+    return None
+
+
+def list_outputs(outputs : list) -> list:
+    """ 선언된 출력 경로를 실제 파일 목록으로 펼칩니다 (폴더는 그 안의 파일들) """
+    files = []
+    for path in outputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names))
+        else:
+            files.append(path)
+    return files
+
+
+class StageRunner():
+    """
+    results/<에피소드>/stages.json 에 단계별 체크포인트를 남기며 단계를 실행합니다.
+    - 각 단계는 입력(inputs)과 출력(outputs)을 선언합니다. 입력의 해시에는 앞 단계(depends)의 해시가 포함됩니다
+    - 입력 해시가 같고 지난 실행의 출력 파일이 모두 남아있으면 그 단계는 건너뜁니다
+    - 단계마다 실행 시간, 처리 개수, 초당 처리량을 results/<에피소드>/run_report.json 에 기록합니다
+    """
+    FILE_NAME = "stages.json"
+    REPORT_NAME = "run_report.json"
+
+    def __init__(self, result_direc : str, force : bool = False):
+        self.result_direc = result_direc
+        self.path = os.path.join(result_direc, self.FILE_NAME)
+        self.report_path = os.path.join(result_direc, self.REPORT_NAME)
+        self.force = force
+        os.makedirs(result_direc, exist_ok=True)
+
+        self.stages = load_json(self.path, default={})
+        self.report = {"started": time.strftime("%Y-%m-%d %H:%M:%S"), "stages": [], "total_sec": 0.0}
+        self._fingerprints = {}
+
+    def fingerprint(self, name : str, inputs : dict, depends=()) -> str:
+        upstream = {dep: self._fingerprints.get(dep, self.stages.get(dep, {}).get("fingerprint")) for dep in depends}
+        payload = json.dumps({"inputs": inputs, "depends": upstream}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def is_fresh(self, name : str, fingerprint : str) -> bool:
+        entry = self.stages.get(name)
+        if self.force or entry is None or entry["fingerprint"] != fingerprint:
+            return False
+        return all(os.path.exists(path) for path in entry["outputs"])
+
+    def run(self, name : str, fn, inputs : dict, outputs : list, depends=()) -> dict:
+        """
+        fn() : 단계를 실행하고 처리한 항목 수를 반환하는 함수
+        출력이 최신이면 fn을 부르지 않고 건너뜁니다. 보고서 항목을 반환합니다.
+        """
+        fingerprint = self.fingerprint(name, inputs, depends)
+        self._fingerprints[name] = fingerprint
+
+        if self.is_fresh(name, fingerprint):
+            entry = {"stage": name, "status": "skipped", "wall_sec": 0.0, "items": self.stages[name]["items"], "items_per_sec": None}
+            print(f"[{name}] outputs are fresh, skipping")
+        else:
+            start = time.perf_counter()
+            items = fn() or 0
+            wall_sec = time.perf_counter() - start
+
+            self.stages[name] = {"fingerprint": fingerprint, "outputs": list_outputs(outputs), "items": items,
+                                 "wall_sec": wall_sec, "finished": time.strftime("%Y-%m-%d %H:%M:%S")}
+            write_json_atomic(self.path, self.stages) # 다음 단계에서 중단되어도 이 단계는 다시 하지 않습니다
+
+            entry = {"stage": name, "status": "ran", "wall_sec": wall_sec, "items": items,
+                     "items_per_sec": items / wall_sec if wall_sec > 0 else None}
+            print(f"[{name}] {items} items in {wall_sec:.2f}s")
+
+        self.report["stages"].append(entry)
+        self.report["total_sec"] += entry["wall_sec"]
+        write_json_atomic(self.report_path, self.report)
+        return entry
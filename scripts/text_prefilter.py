@@ -0,0 +1,53 @@
+import numpy as np
+
+
+TILE = 16            # 타일 한 변 (px)
+BRIGHT_LEVEL = 230   # 이 값 이상이면 말풍선 바탕으로 보는 밝기
+DARK_LEVEL = 96      # 이 값 미만이면 글자 획으로 보는 밝기
+MIN_TEXT_TILES = 4   # 이 개수 이상의 글자 타일이 있으면 OCR로 보냅니다
+
+
+def text_likelihood(panel : np.ndarray, tile : int = TILE,
+                    bright_level : int = BRIGHT_LEVEL, dark_level : int = DARK_LEVEL) -> dict:
+    """
+    컷(RGB 또는 흑백 배열)에 대사가 있을 가능성을 CPU에서 빠르게 추정합니다.
+    컷을 tile x tile 타일로 나누고, 밝은 바탕(말풍선)이 대부분이면서 한 행에 어두운 획이 두 개 이상 지나가는 행이
+    여러 개인(고주파) 타일을 글자 타일로 셉니다. 말풍선 테두리처럼 획이 하나뿐인 타일은 세지 않습니다.
+    모든 계산은 타일 단위로 벡터화되어 있습니다.
+
+    반환값 : {"text_tiles": 글자 타일 수, "bubble_tiles": 밝은 타일 수, "tiles": 전체 타일 수, "score": 글자 타일 비율}
+    """
+    gray = panel if panel.ndim == 2 else panel.astype(np.uint16).sum(axis=2) // 3
+    height, width = gray.shape[0] // tile * tile, gray.shape[1] // tile * tile
+    if height == 0 or width == 0:
+        return {"text_tiles": 0, "bubble_tiles": 0, "tiles": 0, "score": 0.0}
+    gray = gray[:height, :width]
+
+    dark = gray < dark_level
+    bright = gray >= bright_level
+    # 가로 방향으로 어두운 획의 시작과 끝 (글자는 짧은 획이 촘촘하게 반복됩니다)
+    transitions = np.zeros_like(dark)
+    transitions[:, 1:] = dark[:, 1:] != dark[:, :-1]
+
+    def tiles(mask):
+        return mask.reshape(height // tile, tile, width // tile, tile)
+
+    bright_frac = tiles(bright).mean(axis=(1, 3))
+    dark_frac = tiles(dark).mean(axis=(1, 3))
+    # 타일 안에서 획이 두 개 이상(경계 4개 이상) 지나가는 행의 수
+    multi_stroke_rows = (tiles(transitions).sum(axis=3) >= 4).sum(axis=1)
+
+    bubble = bright_frac >= 0.5
+    text = bubble & (dark_frac >= 0.02) & (dark_frac <= 0.45) & (multi_stroke_rows >= 2)
+
+    num_text = int(text.sum())
+    return {
+        "text_tiles": num_text,
+        "bubble_tiles": int(bubble.sum()),
+        "tiles": int(text.size),
+        "score": num_text / text.size,
+    }
+
+
+def likely_has_text(features : dict, min_text_tiles : int = MIN_TEXT_TILES) -> bool:
+    return features["text_tiles"] >= min_text_tiles
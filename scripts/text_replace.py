@@ -0,0 +1,109 @@
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from panel_store import PanelSource
+
+
+_sources = {} # 프로세스별 {에피소드 폴더: PanelSource}
+
+
+@lru_cache(maxsize=64)
+def load_font(font_path : str, font_size : int) -> ImageFont.FreeTypeFont:
+    """ (경로, 크기)별로 한 번만 읽는 폰트 """
+    return ImageFont.truetype(font_path, font_size)
+
+
+def word_boxes(word_infos : list, margin : int, shape : tuple) -> list:
+    """ OCR 단어 bbox에 margin을 더한 (x_min, y_min, x_max, y_max) 마스크 영역들 """
+    height, width = shape[:2]
+    boxes = []
+    for word in word_infos:
+        bbox = word["bbox"]
+        if len(bbox) != 4:
+            continue
+        x_min = max(min(pt["x"] for pt in bbox) - margin, 0)
+        y_min = max(min(pt["y"] for pt in bbox) - margin, 0)
+        x_max = min(max(pt["x"] for pt in bbox) + margin, width)
+        y_max = min(max(pt["y"] for pt in bbox) + margin, height)
+        if x_max > x_min and y_max > y_min:
+            boxes.append((x_min, y_min, x_max, y_max))
+    return boxes
+
+
+def merge_boxes(boxes : list) -> list:
+    """ 겹치거나 맞닿은 사각형을 하나로 합칩니다 """
+    merged = list(boxes)
+    changed = True
+    while changed:
+        changed = False
+        result = []
+        for box in merged:
+            for i, other in enumerate(result):
+                if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                    result[i] = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                    changed = True
+                    break
+            else:
+                result.append(box)
+        merged = result
+    return merged
+
+
+def inpaint_boxes(image : np.ndarray, boxes : list, radius : int) -> np.ndarray:
+    """
+    boxes 영역만 inpaint한 사본을 반환합니다.
+    각 영역에 radius보다 넓은 여백을 붙인 crop에서만 cv2.inpaint를 돌리고 붙여넣으므로, 컷 전체를 inpaint한 결과와 같습니다.
+    """
+    height, width = image.shape[:2]
+    mask = np.zeros((height, width), dtype=np.uint8)
+    for x_min, y_min, x_max, y_max in boxes:
+        mask[y_min:y_max, x_min:x_max] = 255
+
+    pad = radius + 2
+    padded = [(max(x_min - pad, 0), max(y_min - pad, 0), min(x_max + pad, width), min(y_max + pad, height))
+              for x_min, y_min, x_max, y_max in boxes]
+
+    result = np.array(image)
+    for x_min, y_min, x_max, y_max in merge_boxes(padded):
+        crop = np.ascontiguousarray(image[y_min:y_max, x_min:x_max])
+        crop_mask = np.ascontiguousarray(mask[y_min:y_max, x_min:x_max])
+        result[y_min:y_max, x_min:x_max] = cv2.inpaint(crop, crop_mask, radius, cv2.INPAINT_TELEA)
+    return result
+
+
+def draw_replacement(pil_img : Image.Image, word_infos : list, replacement_word : str, font_path : str) -> None:
+    draw = ImageDraw.Draw(pil_img)
+    for word in word_infos:
+        bbox = word["bbox"]
+        color = word["color"]
+        size = word["size"]
+        if len(bbox) != 4:
+            continue
+        font_size = max(int(size["height"] * 1.15), 10)
+        x_min = min(pt["x"] for pt in bbox)
+        y_min = min(pt["y"] for pt in bbox)
+        text_color = (color["r"], color["g"], color["b"])
+        draw.text((x_min, y_min), replacement_word, fill=text_color, font=load_font(font_path, font_size))
+
+
+def replace_panel(episode_direc : str, name : str, image : np.ndarray, word_infos : list, save_path : str,
+                  replacement_word : str, font_path : str, margin : int, inpaint_radius : int) -> str:
+    """
+    컷 하나의 OCR 영역을 inpaint하고 replacement_word로 다시 써서 save_path에 저장합니다 (프로세스 풀 작업 단위)
+    image가 None이면 이 프로세스에서 episode_direc의 패널 인덱스를 직접 읽습니다.
+    """
+    if image is None:
+        if episode_direc not in _sources:
+            _sources[episode_direc] = PanelSource(episode_direc)
+        image = _sources[episode_direc].load(name)
+
+    boxes = word_boxes(word_infos, margin, image.shape)
+    inpainted = inpaint_boxes(image, boxes, inpaint_radius) if boxes else image
+    pil_img = Image.fromarray(inpainted)
+    draw_replacement(pil_img, word_infos, replacement_word, font_path)
+
+    pil_img.save(save_path)
+    return save_path
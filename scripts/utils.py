@@ -1,82 +1,247 @@
+import io
 import os
-import cv2
-import json
-import time
-import glob
-import requests
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
 import numpy as np
-import torchvision.models as models
-import torch.nn as nn
 import torch
-import torchvision.transforms as transforms
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import shutil
 
+from cascade import CascadeClassifier, Embedder
+from classifier import BatchClassifier, build_student, build_vgg19, make_transform
+from dedup import GROUPS_NAME, MAX_DISTANCE, dedup_faces, load_prior
+from face_attributes import AttributeFilter, AttributeIndex
+from face_quality import MIN_CONTRAST, MIN_RESOLUTION, MIN_SHARPNESS, crop_quality, quality_gate
+from label_store import JsonlStore, LabelStore
+from manifest import ContentCache, load_json, write_json_atomic
+from ocr_client import UpstageOCRClient
+from panel_store import PanelSource
+from stages import StageRunner, path_fingerprint
+from text_prefilter import MIN_TEXT_TILES, likely_has_text, text_likelihood
+from text_replace import replace_panel
+
 class Do_OCR_FACECROP():
     PROTAGONIST_LABEL = 1
+    STAGES = ("ocr", "inpaint", "face_crop", "classify", "collect", "dedup")
 
     def __init__(self, episode_num, ocr_api_key, replacement_word, font_path,
                  target_words=["신재현", "재현", "신팀장", "신선생"],
-                 margin=5, inpaint_radius=5, model_path="model_weights.pth", device=None):
+                 margin=5, inpaint_radius=5, model_path="model_weights.pth", device=None,
+                 ocr_qps=1.0, ocr_in_flight=4, ocr_cache_dir="cache/ocr", ocr_batch_pages=10,
+                 ocr_prefilter="on", min_text_tiles=MIN_TEXT_TILES,
+                 ocr_max_side=2048, ocr_format="JPEG", ocr_quality=90, panel_cache_mb=512,
+                 replace_workers=None, run_stages=True, force=False,
+                 classify_batch_size=16, classify_workers=None, channels_last=True, bf16=False,
+                 classifier_arch="vgg19", student_path="student_weights.pth", cascade_path=None,
+                 face_min_resolution=MIN_RESOLUTION, face_min_sharpness=MIN_SHARPNESS, face_min_contrast=MIN_CONTRAST,
+                 face_max_yaw=None, face_max_pitch=None, face_min_facequality=None, face_max_blur=None,
+                 face_min_eye_open=None, face_missing_attributes="pass",
+                 dedup_max_distance=MAX_DISTANCE, dedup_embedder=None, dedup_scope="episode"):
 
         self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = models.vgg19(pretrained=False)
-        num_features = self.model.classifier[6].in_features
-        num_classes = 2  # 실제 분류 클래스 수 (필요시 변경)
-        self.model.classifier[6] = nn.Linear(num_features, num_classes)
-        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-        self.model.to(self.device)
-        self.model.eval()
-
-        self.transform = transforms.Compose([
-            transforms.Resize((512, 512)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406],
-                                 std=[0.229, 0.224, 0.225])
-        ])
+        # classifier_arch가 "vgg19"가 아니면 distill.py로 증류한 경량 학생 모델(224 px)을 student_path에서 불러옵니다
+        self.classifier_arch = classifier_arch
+        if classifier_arch == "vgg19":
+            self.model = build_vgg19(model_path, self.device, num_classes=2) # 실제 분류 클래스 수 (필요시 변경)
+            self.transform = make_transform(512)
+        else:
+            self.model = build_student(classifier_arch, num_classes=2, weights_path=student_path, device=self.device)
+            self.transform = make_transform(224)
+            model_path = student_path
+        # 배치 추론 : DataLoader 작업 프로세스가 크롭을 디코딩하는 동안 모델이 배치 단위로 계산합니다
+        self.classifier = BatchClassifier(self.model, self.transform, self.device, batch_size=classify_batch_size,
+                                          num_workers=classify_workers, channels_last=channels_last, bf16=bf16)
+        # cascade_path(cascade.py로 보정한 JSON)를 주면 임베딩 + 선형 헤드가 확실한 크롭을 먼저 판정하고 나머지만 위 모델로 넘깁니다
+        self.cascade_path = cascade_path
+        if cascade_path is not None:
+            self.classifier = CascadeClassifier(cascade_path, self.classifier, self.device,
+                                                batch_size=classify_batch_size, num_workers=classify_workers)
 
         self.episode = str(episode_num)
+        self.model_path = model_path
         self.ocr_api_key = ocr_api_key
         self.replacement_word = replacement_word
         self.target_words = target_words
         self.font_path = font_path
         self.margin = margin
         self.inpaint_radius = inpaint_radius
+        self.replace_workers = replace_workers # 텍스트 치환 프로세스 수 (None이면 CPU 코어 수)
+        # 얼굴 크롭 품질 기준 (저장 전에 메모리에서 검사합니다)
+        self.face_min_resolution = face_min_resolution
+        self.face_min_sharpness = face_min_sharpness
+        self.face_min_contrast = face_min_contrast
+        # Face++ 속성 조건 (None이면 검사하지 않음). 탈락한 얼굴은 크롭, 분류, 스타일 변환 모두 하지 않습니다
+        # face_missing_attributes : 속성이 없는 라벨(로컬 dlib 백엔드)을 "pass"면 통과, "reject"면 탈락시킵니다
+        self.face_filter = AttributeFilter(max_abs_yaw=face_max_yaw, max_abs_pitch=face_max_pitch,
+                                           min_facequality=face_min_facequality, max_blur=face_max_blur,
+                                           min_eye_open=face_min_eye_open, missing=face_missing_attributes)
+        # 주인공 크롭 중복 묶기 : pHash 해밍 거리 dedup_max_distance 이하를 한 묶음으로 (dedup_embedder를 주면 임베딩 유사도도 확인)
+        self.dedup_max_distance = dedup_max_distance
+        self.dedup_embedder = dedup_embedder
+        # "episode"면 이 에피소드 안에서만, "series"면 앞 에피소드들의 주인공 크롭과 함께 묶습니다 (대표가 앞 에피소드의 크롭이면 그 변환 결과를 재사용)
+        if dedup_scope not in ("episode", "series"):
+            raise ValueError(f"dedup_scope must be 'episode' or 'series', got {dedup_scope}")
+        self.dedup_scope = dedup_scope
+        self.ocr_qps = ocr_qps # Upstage 요청 속도 제한 (초당 요청 수)
+        self.ocr_in_flight = ocr_in_flight # 동시에 보내는 최대 요청 수
+        self.ocr_cache_dir = ocr_cache_dir # 컷 내용 sha1별 원본 OCR 응답 (target_words를 바꿔도 다시 업로드하지 않습니다)
+        self.ocr_batch_pages = ocr_batch_pages # 요청 한 번에 다중 페이지 문서로 묶어 보내는 컷 수
+        # 업로드 준비 : 긴 변을 ocr_max_side 이하로 줄이고 ocr_format("PNG", "JPEG", "WEBP") / ocr_quality로 인코딩합니다 (좌표는 원본 기준으로 되돌려 받습니다)
+        self.ocr_max_side = ocr_max_side
+        self.ocr_format = ocr_format
+        self.ocr_quality = ocr_quality
+        # 말풍선 사전 필터 : "on"이면 대사가 없어 보이는 컷은 OCR을 건너뛰고, "audit"이면 모든 컷을 OCR하여 필터의 놓친 컷을 기록, "off"면 사용하지 않습니다
+        if ocr_prefilter not in ("on", "off", "audit"):
+            raise ValueError(f"ocr_prefilter must be 'on', 'off' or 'audit', got {ocr_prefilter}")
+        self.ocr_prefilter = ocr_prefilter
+        self.min_text_tiles = min_text_tiles
 
         # dataset/<episode>/img, label
         self.img_dir = f"dataset/{self.episode}/img"
+        # 패널 인덱스가 있으면 PNG 대신 인덱스에서 컷을 읽고, PNG는 panel_cache_mb까지 디코딩 결과를 모든 단계가 공유합니다
+        self.panels = PanelSource(f"dataset/{self.episode}", cache_bytes=int(panel_cache_mb * 2**20))
         self.result_dir = f"results/{self.episode}/ocr_results"
+        self.prefilter_path = f"results/{self.episode}/ocr_prefilter.json"
+        # 단계 사이에 넘기는 결과 (중간부터 다시 실행할 때 읽습니다)
+        self.ocr_words_path = f"results/{self.episode}/ocr_words.json"
+        self.protagonist_path = f"results/{self.episode}/protagonist_faces.json"
+        self.probabilities_path = f"results/{self.episode}/protagonist_probabilities.json"
+        # 얼굴 크롭 정보 (크롭마다 JSON 파일을 만들지 않고 한 줄씩 모읍니다)
+        self.face_crops_path = f"results/{self.episode}/face_crops.jsonl"
+        self.cropped_faces_path = f"results/{self.episode}/cropped_faces.jsonl"
+        self.face_groups_path = f"results/{self.episode}/{GROUPS_NAME}" # 스타일 변환은 묶음의 대표 크롭만 합니다
         os.makedirs(self.result_dir, exist_ok=True)
 
         self.ocr_results = {}
+        self.protagnoist_face_list = []
+        self.face_probabilities = {}
+        self.report = None
+
+        # 1) OCR -> 2) Inpainting + 텍스트 치환 -> 3) 얼굴 크롭 -> 4) 주인공 여부 분류 -> 5) 주인공 얼굴만 cropped_faces로 복사
+        # run_stages=False로 만들면 run() / run_stage()로 원하는 단계만 따로 실행할 수 있습니다
+        if run_stages:
+            self.run(force=force)
+
+        # [중요] temporary 폴더 삭제하지 않도록 아래 줄 주석 처리 또는 제거
+        # self.remove_temporary_dirs(dirs=["temporary_crops"])
 
-        # 1) OCR
+    def run(self, stages=STAGES, force=False):
+        """
+        단계를 순서대로 실행합니다. 입력이 그대로이고 출력이 남아있는 단계는 건너뜁니다 (force=True면 모두 다시 실행).
+        단계별 시간과 처리량은 results/<episode>/run_report.json 에 남습니다.
+        """
+        runner = StageRunner(f"results/{self.episode}", force=force)
+        for name in stages:
+            self.run_stage(name, runner)
+        self.report = runner.report
+        return self.report
+
+    def run_stage(self, name, runner=None):
+        """ 단계 하나를 체크포인트와 함께 실행하고 보고서 항목을 반환합니다 """
+        runner = runner or StageRunner(f"results/{self.episode}")
+        fn, inputs, outputs, depends = self.stage_spec(name)
+        return runner.run(name, fn, inputs, outputs, depends)
+
+    def stage_spec(self, name):
+        """ 단계별 (실행 함수, 입력, 출력 경로, 앞 단계) """
+        result_direc = f"results/{self.episode}"
+        if name == "ocr":
+            inputs = {"panels": self.panel_hashes(), "target_words": self.target_words, "prefilter": self.ocr_prefilter,
+                      "min_text_tiles": self.min_text_tiles, "max_side": self.ocr_max_side,
+                      "format": self.ocr_format, "quality": self.ocr_quality}
+            return self.stage_ocr, inputs, [self.ocr_words_path], ()
+        if name == "inpaint":
+            inputs = {"replacement_word": self.replacement_word, "font": [self.font_path, path_fingerprint(self.font_path)],
+                      "margin": self.margin, "inpaint_radius": self.inpaint_radius}
+            return self.stage_inpaint, inputs, [self.result_dir], ("ocr",)
+        if name == "face_crop":
+            inputs = {"panels": self.panel_hashes(), "labels": path_fingerprint(f"dataset/{self.episode}/{LabelStore.FILE_NAME}"),
+                      "quality": [self.face_min_resolution, self.face_min_sharpness, self.face_min_contrast],
+                      "attributes": self.face_filter.config()}
+            return self.stage_face_crop, inputs, [f"{result_direc}/temporary_crops", self.face_crops_path], ()
+        if name == "classify":
+            inputs = {"arch": self.classifier_arch, "model": [self.model_path, path_fingerprint(self.model_path)],
+                      "cascade": [self.cascade_path, path_fingerprint(self.cascade_path)] if self.cascade_path else None}
+            return self.stage_classify, inputs, [self.protagonist_path, self.probabilities_path], ("face_crop",)
+        if name == "collect":
+            return self.stage_collect, {}, [f"{result_direc}/cropped_faces", self.cropped_faces_path], ("classify",)
+        if name == "dedup":
+            inputs = {"max_distance": self.dedup_max_distance, "embedder": self.dedup_embedder, "scope": self.dedup_scope,
+                      "prior": {ep: path_fingerprint(f"results/{ep}/cropped_faces") for ep in self.prior_episodes()}}
+            return self.stage_dedup, inputs, [self.face_groups_path], ("collect",)
+        raise ValueError(f"Unknown stage {name}, expected one of {self.STAGES}")
+
+    def panel_hashes(self):
+        return {path: self.panels.sha1(path) for path in self.panels.names()}
+
+    def stage_ocr(self):
+        self.ocr_results = {}
         self.ocr()
-        # 2) Inpainting + 텍스트 치환
+        write_json_atomic(self.ocr_words_path, self.ocr_results)
+        return len(self.ocr_results)
+
+    def stage_inpaint(self):
+        if not self.ocr_results:
+            self.ocr_results = load_json(self.ocr_words_path, default={})
         self.inpaint_and_replace()
-        # 3) 얼굴 크롭 (해당 episode_num만)
-        self.naive_face_crop(episode_num)
-        # 4) 주인공 여부 분류
+        return len(self.ocr_results)
+
+    def stage_face_crop(self):
+        self.naive_face_crop(self.episode)
+        crops_dir = f"results/{self.episode}/temporary_crops"
+        return len(os.listdir(crops_dir)) if os.path.isdir(crops_dir) else 0
+
+    def stage_classify(self):
         self.protagnoist_face_list = self.is_it_protagonist()
-        # 5) 주인공 얼굴만 최종 cropped_faces / cropped_faces_json 에 복사
+        write_json_atomic(self.protagonist_path, self.protagnoist_face_list)
+        write_json_atomic(self.probabilities_path, {"probabilities": self.face_probabilities,
+                                                    "images_per_sec": self.classifier.stats["images_per_sec"],
+                                                    "classifier_stats": self.classifier.stats})
+        return len(self.face_probabilities)
+
+    def stage_collect(self):
+        if not self.protagnoist_face_list:
+            self.protagnoist_face_list = load_json(self.protagonist_path, default=[])
         self.get_protagonist_face_json(face_list=self.protagnoist_face_list)
+        return len(self.protagnoist_face_list)
+
+    def stage_dedup(self):
+        if not self.protagnoist_face_list:
+            self.protagnoist_face_list = load_json(self.protagonist_path, default=[])
+        embedder = None
+        if self.dedup_embedder is not None:
+            embedder = Embedder(self.dedup_embedder, device=self.device).embed
+        prior = [load_prior(ep, f"results/{ep}/cropped_faces", f"results/{ep}/{GROUPS_NAME}",
+                            names=load_json(f"results/{ep}/protagonist_faces.json")) for ep in self.prior_episodes()]
+        report = dedup_faces(f"results/{self.episode}/cropped_faces", self.face_groups_path, max_distance=self.dedup_max_distance,
+                             embedder=embedder, names=self.protagnoist_face_list, prior=prior)
+        print(f" {report['crops']} protagonist crops -> {report['representatives']} to style-transfer"
+              f" ({report['reused_from_prior']} reuse earlier episodes)")
+        return report["crops"]
+
+    def prior_episodes(self):
+        """ dedup_scope="series"일 때 함께 묶을 앞 에피소드 (results/<번호>/cropped_faces가 있는 것, 번호 순) """
+        if self.dedup_scope != "series" or not os.path.isdir("results"):
+            return []
+        return sorted((ep for ep in os.listdir("results") if ep.isdigit() and self.episode.isdigit()
+                       and int(ep) < int(self.episode) and os.path.isdir(f"results/{ep}/cropped_faces")), key=int)
 
-        # [중요] temporary 폴더 삭제하지 않도록 아래 줄 주석 처리 또는 제거
-        # self.remove_temporary_dirs(dirs=["temporary_crops", "temporary_jsons"])
+    def make_ocr_client(self):
+        return UpstageOCRClient(self.ocr_api_key, cache_direc=self.ocr_cache_dir,
+                                qps=self.ocr_qps, max_in_flight=self.ocr_in_flight,
+                                max_side=self.ocr_max_side, upload_format=self.ocr_format, quality=self.ocr_quality)
 
     def run_ocr_api(self, image_path):
-        """ OCR API 호출 """
-        url = "https://api.upstage.ai/v1/document-ai/ocr"
-        headers = {"Authorization": f"Bearer {self.ocr_api_key}"}
+        """ 이미지 파일 한 장의 OCR API 호출 (캐시, 속도 제한, 재시도, 업로드 준비 포함). 좌표는 image_path의 픽셀 기준입니다 """
         with open(image_path, "rb") as f:
-            files = {"document": f}
-            response = requests.post(url, headers=headers, files=files)
-            response.raise_for_status()
-            return response.json()
-
-    def get_text_color(self, image_path, bbox, threshold=200):
-        """ OCR 영역의 대표 색상(검정색 가정)을 추출하기 위한 예시 메서드 """
-        image = cv2.imread(image_path)
+            image_bytes = f.read()
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            panel = np.asarray(img.convert("RGB"))
+        with self.make_ocr_client() as client:
+            return client.recognize_batch([(ContentCache.key(image_bytes), lambda: panel)])[0]
+
+    def get_text_color(self, image, bbox, threshold=200):
+        """ OCR 영역의 대표 색상(검정색 가정)을 추출하기 위한 예시 메서드 (image : RGB 배열) """
         if image is None or len(bbox) != 4:
             return {"r": 0, "g": 0, "b": 0}
         x_min = min(pt["x"] for pt in bbox)
@@ -86,10 +251,12 @@ class Do_OCR_FACECROP():
         roi = image[y_min:y_max, x_min:x_max]
         if roi.size == 0:
             return {"r": 0, "g": 0, "b": 0}
-        roi = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
+        # 밝기 평균이 threshold 미만인 첫 픽셀 (정수 합으로 비교하여 np.mean과 같은 결과)
         pixels = roi.reshape(-1, 3)
-        filtered = [tuple(c) for c in pixels if np.mean(c) < threshold]
-        return dict(zip(["r", "g", "b"], filtered[0])) if filtered else {"r": 0, "g": 0, "b": 0}
+        dark = pixels.astype(np.uint16).sum(axis=1) < 3 * threshold
+        if not dark.any():
+            return {"r": 0, "g": 0, "b": 0}
+        return dict(zip(["r", "g", "b"], (int(c) for c in pixels[np.argmax(dark)])))
 
     def get_text_size(self, bbox):
         """ OCR bbox의 폭, 높이 계산 """
@@ -100,86 +267,126 @@ class Do_OCR_FACECROP():
         return {"width": width, "height": height}
 
     def ocr(self):
-        """ 이미지별로 OCR 수행 후, 타겟 단어(예: '신재현' 등) 포함된 영역만 추출 """
-        img_paths = sorted([p for ext in ["*.jpg", "*.png"] for p in glob.glob(f"{self.img_dir}/{ext}")])
-        for path in img_paths:
-            try:
-                result = self.run_ocr_api(path)
-                matched_words = []
-                for word in result.get("pages", [{}])[0].get("words", []):
-                    text = word.get("text", "")
-                    if any(t in text for t in self.target_words):
-                        bbox = word.get("boundingBox", {}).get("vertices", [])
-                        color = self.get_text_color(path, bbox)
-                        size = self.get_text_size(bbox)
-                        matched_words.append({
-                            "text": text, "bbox": bbox, "color": color, "size": size
-                        })
-                self.ocr_results[path] = matched_words
-                print(f" OCR success: {path}")
-                time.sleep(1)
-            except Exception as e:
-                print(f" OCR failed: {path} ({e})")
-
-    def inpaint_and_replace(self):
-        """ OCR 영역을 마스크로 만들어 테두리 보정(inpaint) 후, replacement_word로 치환하여 저장 """
-        for img_path, word_infos in self.ocr_results.items():
-            original = cv2.imread(img_path)
-            if original is None:
-                continue
-            mask = np.zeros(original.shape[:2], dtype=np.uint8)
-            for word in word_infos:
-                bbox = word["bbox"]
-                if len(bbox) != 4:
-                    continue
-                x_min = max(min(pt["x"] for pt in bbox) - self.margin, 0)
-                y_min = max(min(pt["y"] for pt in bbox) - self.margin, 0)
-                x_max = min(max(pt["x"] for pt in bbox) + self.margin, original.shape[1])
-                y_max = min(max(pt["y"] for pt in bbox) + self.margin, original.shape[0])
-                mask[y_min:y_max, x_min:x_max] = 255
-
-            # inpaint
-            inpainted = cv2.inpaint(original, mask, self.inpaint_radius, cv2.INPAINT_TELEA)
-            pil_img = Image.fromarray(cv2.cvtColor(inpainted, cv2.COLOR_BGR2RGB))
-            draw = ImageDraw.Draw(pil_img)
-
-            # 텍스트 다시 쓰기
-            for word in word_infos:
-                bbox = word["bbox"]
-                color = word["color"]
-                size = word["size"]
-                if len(bbox) != 4:
+        """
+        이미지별로 OCR 수행 후, 타겟 단어(예: '신재현' 등) 포함된 영역만 추출
+        컷 ocr_batch_pages개를 다중 페이지 문서 하나로 묶어 동시에 요청하고, 결과는 컷 순서대로 처리합니다
+        """
+        names = self.panels.names()
+        decisions = self.prefilter_panels(names) if self.ocr_prefilter != "off" else {}
+        skipped = [path for path in decisions if not decisions[path]["send"]]
+        if self.ocr_prefilter == "on":
+            names = [path for path in names if path not in skipped]
+        batches = [names[i:i + self.ocr_batch_pages] for i in range(0, len(names), self.ocr_batch_pages)]
+
+        with self.make_ocr_client() as client:
+            futures = [client.submit_batch([(self.panels.sha1(path), partial(self.panels.load, path)) for path in batch])
+                       for batch in batches]
+            for batch, future in zip(batches, futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    for path in batch:
+                        print(f" OCR failed: {path} ({e})")
                     continue
-                font_size = max(int(size["height"] * 1.15), 10)
-                font = ImageFont.truetype(self.font_path, font_size)
-                x_min = min(pt["x"] for pt in bbox)
-                y_min = min(pt["y"] for pt in bbox)
-                text_color = (color["r"], color["g"], color["b"])
-                draw.text((x_min, y_min), self.replacement_word, fill=text_color, font=font)
+                for path, result in zip(batch, results):
+                    self.ocr_results[path] = self.match_target_words(path, result)
+                    if path in decisions:
+                        decisions[path]["ocr_words"] = len(result.get("pages", [{}])[0].get("words", []))
+                    print(f" OCR success: {path}")
+            print(f" OCR requests: {client.stats['uploads']} ({client.stats['pages']} pages, {client.stats['bytes'] / 1e6:.1f} MB), "
+                  f"cache hits: {client.stats['cache_hits']}")
+
+        if self.ocr_prefilter == "on":
+            for path in skipped:
+                self.ocr_results[path] = [] # 치환할 글자가 없으므로 원본 그대로 저장됩니다
+            print(f" OCR prefilter skipped {len(skipped)} panels")
+        if decisions:
+            self.save_prefilter_report(decisions)
+
+    def prefilter_panels(self, names):
+        """ 컷마다 대사 가능성 특징과 OCR 전송 여부를 계산 """
+        decisions = {}
+        for path in names:
+            features = text_likelihood(self.panels.load(path))
+            decisions[path] = {**features, "send": likely_has_text(features, self.min_text_tiles)}
+        return decisions
+
+    def save_prefilter_report(self, decisions):
+        """
+        사전 필터의 판단을 results/<episode>/ocr_prefilter.json 에 기록합니다.
+        audit 모드에서는 OCR 결과(ocr_words)와 비교하여, 글자가 있는데 필터가 건너뛰었을 컷(missed)과 재현율(recall)을 함께 남깁니다.
+        """
+        report = {"mode": self.ocr_prefilter, "min_text_tiles": self.min_text_tiles, "panels": decisions,
+                  "sent": sum(d["send"] for d in decisions.values()), "total": len(decisions)}
+        if self.ocr_prefilter == "audit":
+            with_text = [path for path, d in decisions.items() if d.get("ocr_words", 0) > 0]
+            missed = [path for path in with_text if not decisions[path]["send"]]
+            report["missed"] = missed
+            report["recall"] = 1 - len(missed) / len(with_text) if with_text else 1.0
+            print(f" OCR prefilter recall: {report['recall']:.3f} (missed {len(missed)}/{len(with_text)})")
+        write_json_atomic(self.prefilter_path, report)
+
+    def match_target_words(self, path, result):
+        """ OCR 응답에서 타겟 단어가 포함된 단어의 bbox, 색상, 크기를 추출 """
+        image = None
+        matched_words = []
+        for word in result.get("pages", [{}])[0].get("words", []):
+            text = word.get("text", "")
+            if any(t in text for t in self.target_words):
+                bbox = word.get("boundingBox", {}).get("vertices", [])
+                if image is None:
+                    image = self.panels.load(path)
+                color = self.get_text_color(image, bbox)
+                size = self.get_text_size(bbox)
+                matched_words.append({
+                    "text": text, "bbox": bbox, "color": color, "size": size
+                })
+        return matched_words
 
-            save_path = os.path.join(self.result_dir, os.path.basename(img_path))
-            pil_img.save(save_path)
-            print(f" Saved: {save_path}")
+    def inpaint_and_replace(self):
+        """
+        OCR 영역을 마스크로 만들어 테두리 보정(inpaint) 후, replacement_word로 치환하여 저장
+        컷마다 프로세스 풀에서 단어 영역 주변만 inpaint하고 다시 씁니다 (text_replace.replace_panel)
+        """
+        episode_direc = f"dataset/{self.episode}"
+        with ProcessPoolExecutor(max_workers=self.replace_workers) as executor:
+            futures = []
+            for img_path, word_infos in self.ocr_results.items():
+                # 패널 인덱스는 작업 프로세스가 memmap으로 직접 읽고, PNG는 이미 디코딩한 배열을 넘깁니다
+                image = None if self.panels.use_store else self.panels.load(img_path)
+                save_path = os.path.join(self.result_dir, os.path.basename(img_path))
+                futures.append(executor.submit(replace_panel, episode_direc, img_path, image, word_infos, save_path,
+                                               self.replacement_word, self.font_path, self.margin, self.inpaint_radius))
+
+            for future in as_completed(futures):
+                try:
+                    print(f" Saved: {future.result()}")
+                except Exception as e:
+                    print(f" Replace failed ({e})")
 
     def naive_face_crop(self, episode_num):
         """
         주어진 에피소드에 대해,
-        dataset/<episode>/label 내 JSON(얼굴좌표) 정보를 참고하여 
-        얼굴을 크롭한 뒤 results/<episode>/temporary_crops, temporary_jsons 폴더에 저장.
+        dataset/<episode>/labels.jsonl 의 얼굴좌표를 컷 이름으로 조회하여
+        얼굴을 크롭한 뒤 results/<episode>/temporary_crops 폴더에, 크롭 정보는 results/<episode>/face_crops.jsonl 에 저장.
+        속성 조건(self.face_filter)에 맞지 않는 얼굴은 자르지 않고, 저화질 크롭(해상도, 대비, 선명도 기준)은 메모리에서 걸러 저장하지 않습니다.
+        탈락 사유는 face_crop_rejections.json 에 남깁니다.
         """
 
         episode_path = f"dataset/{episode_num}"
-        img_folder = f"{episode_path}/img"
-        label_folder = f"{episode_path}/label"
 
         
         output_episode_dir_img = f"results/{episode_num}/temporary_crops"
         os.makedirs(output_episode_dir_img, exist_ok=True)
 
-        output_episode_dir_json = f"results/{episode_num}/temporary_jsons"
-        os.makedirs(output_episode_dir_json, exist_ok=True)
+        # 지난 실행의 크롭이 남아 분류 단계에 섞이지 않도록 비웁니다
+        for file in os.listdir(output_episode_dir_img):
+            if os.path.isfile(f"{output_episode_dir_img}/{file}"):
+                os.remove(f"{output_episode_dir_img}/{file}")
+        crop_records = []
 
         faces_failed = []  # 얼굴 검출 실패 이미지 리스트
+        rejections = []    # 속성 조건 / 품질 기준에서 탈락한 얼굴
 
         
         if not os.path.isdir(episode_path):
@@ -187,33 +394,28 @@ class Do_OCR_FACECROP():
             return
 
 
-        for img_file in os.listdir(img_folder):
-            if not img_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                continue
+        panels = self.panels if str(episode_num) == self.episode else PanelSource(episode_path)
+        labels = LabelStore(episode_path)
+        attribute_index = AttributeIndex(labels)
+        attribute_rejections = attribute_index.select(self.face_filter)
 
-            img_path = f"{img_folder}/{img_file}"
+        for img_file in panels.names():
             base_name, ext = os.path.splitext(img_file)
-            json_path = f"{label_folder}/{base_name}.json"
 
-            if not os.path.exists(json_path):
-                faces_failed.append(img_file)
-                continue
-
-            with open(json_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError:
-                    faces_failed.append(img_file)
-                    continue
-
-            faces = data.get("faces", [])
+            faces = labels.faces(img_file)
             if not faces:
                 faces_failed.append(img_file)
                 continue
 
-            image = Image.open(img_path)
+            image = None # 속성 조건을 통과한 얼굴이 있을 때만 컷을 읽습니다
 
             for idx, face in enumerate(faces, start=1):
+                reason = attribute_rejections.get((img_file, idx))
+                if reason is not None:
+                    rejections.append({"crop": f"{base_name}_face{idx}{ext}", "original_image": img_file, "face_index": idx,
+                                       "reason": reason, **attribute_index.attributes(img_file, idx)})
+                    continue
+
                 landmark = face.get("landmark")
                 if not landmark:
                     continue
@@ -239,6 +441,10 @@ class Do_OCR_FACECROP():
                 min_y = min(ys)
                 max_y = max(ys)
 
+                if image is None:
+                    image = panels.load(img_file) # 패널 인덱스의 view (필요한 얼굴 영역만 복사됩니다)
+                    image_height, image_width = image.shape[:2]
+
                 # 패딩 (이미지 크롭)
                 padding_x = int((max_x - min_x) * 0.2)
                 padding_y_top = int((max_y - min_y) * 1.0)
@@ -254,22 +460,29 @@ class Do_OCR_FACECROP():
                 new_left = max(0, min_x - padding_x)
                 new_top = max(0, min_y - padding_y_top)
                 new_top = min(new_top, limited_top)
-                new_right = min(image.width, max_x + padding_x)
-                new_bottom = min(image.height, max_y + padding_y_bottom)
+                new_right = min(image_width, max_x + padding_x)
+                new_bottom = min(image_height, max_y + padding_y_bottom)
 
                 if new_right <= new_left or new_bottom <= new_top:
                     continue
 
-                # 얼굴 크롭
-                face_crop = image.crop((new_left, new_top, new_right, new_bottom))
+                # 얼굴 크롭 (품질 검사를 통과한 크롭만 저장합니다)
+                crop = image[new_top:new_bottom, new_left:new_right]
                 output_filename = f"{base_name}_face{idx}{ext}"
+                metrics = crop_quality(crop)
+                reason = quality_gate(metrics, self.face_min_resolution, self.face_min_sharpness, self.face_min_contrast)
+                if reason is not None:
+                    rejections.append({"crop": output_filename, "original_image": img_file, "face_index": idx,
+                                       "reason": reason, **metrics})
+                    continue
+
+                face_crop = Image.fromarray(np.ascontiguousarray(crop))
                 output_path = f"{output_episode_dir_img}/{output_filename}"
                 face_crop.save(output_path)
 
-                # 크롭 정보 JSON 저장
-                json_output_filename = f"{base_name}_face{idx}.json"
-                json_output_path = f"{output_episode_dir_json}/{json_output_filename}"
-                face_crop_info = {
+                # 크롭 정보
+                crop_records.append({
+                    "crop": output_filename,
                     "episode": episode_num,
                     "original_image": img_file,
                     "face_index": idx,
@@ -279,29 +492,17 @@ class Do_OCR_FACECROP():
                         "right": new_right,
                         "bottom": new_bottom
                     }
-                }
-                with open(json_output_path, "w", encoding="utf-8") as jf:
-                    json.dump(face_crop_info, jf, indent=4, ensure_ascii=False)
+                })
 
-        # ──────────────────────────────────────────────────────
-        # 저화질 이미지 필터링
-        file_size_threshold = 7.21  # KB
-        min_resolution = 100        # 픽셀
+        JsonlStore(f"results/{episode_num}/face_crops.jsonl", key="crop").rewrite(crop_records)
 
-        for file in os.listdir(output_episode_dir_img):
-            if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                file_path = f"{output_episode_dir_img}/{file}"
-                file_size_kb = os.path.getsize(file_path) / 1024.0
-                try:
-                    with Image.open(file_path) as img:
-                        width, height = img.size
-                except Exception:
-                    os.remove(file_path)
-                    continue
-
-                if file_size_kb <= file_size_threshold or width < min_resolution or height < min_resolution:
-                    os.remove(file_path)
-        # ──────────────────────────────────────────────────────
+        # 탈락 사유 기록
+        reasons = {}
+        for rejection in rejections:
+            reasons[rejection["reason"]] = reasons.get(rejection["reason"], 0) + 1
+        write_json_atomic(f"results/{episode_num}/face_crop_rejections.json", {"counts": reasons, "rejections": rejections})
+        if rejections:
+            print(f" Rejected {len(rejections)} faces {reasons}")
 
         # 실패 목록 저장
         if faces_failed:
@@ -313,7 +514,8 @@ class Do_OCR_FACECROP():
     def is_it_protagonist(self):
         """
         results/<episode>/temporary_crops 폴더 안의 얼굴들을 
-        self.model로 분류한 뒤, 주인공 클래스(PROTAGONIST_LABEL)면 리스트에 추가.
+        self.classifier로 배치 분류한 뒤, 주인공 클래스(PROTAGONIST_LABEL)면 리스트에 추가.
+        크롭별 클래스 확률은 self.face_probabilities에 남깁니다.
         """
         temp_crops_dir = f"results/{self.episode}/temporary_crops"
 
@@ -323,52 +525,39 @@ class Do_OCR_FACECROP():
             print(f"Cannot find temporary_crops: {temp_crops_dir}")
             return []
 
-        cropped_face_list = os.listdir(temp_crops_dir)
-        protagonist_face_list = []
-
-        for face in cropped_face_list:
-            face_path = f"{temp_crops_dir}/{face}"
-            if not os.path.isfile(face_path):
-                continue
+        cropped_face_list = [face for face in sorted(os.listdir(temp_crops_dir))
+                             if os.path.isfile(f"{temp_crops_dir}/{face}")]
+        probabilities = self.classifier.predict([f"{temp_crops_dir}/{face}" for face in cropped_face_list])
 
-            img = Image.open(face_path).convert("RGB")
-            img_tensor = self.transform(img).unsqueeze(0).to(self.device)
-
-            with torch.no_grad():
-                output = self.model(img_tensor)
-                pred = torch.argmax(output, dim=1).item()
-
-            if pred == self.PROTAGONIST_LABEL:
-                protagonist_face_list.append(face)
+        self.face_probabilities = {face: [float(p) for p in prob] for face, prob in zip(cropped_face_list, probabilities)}
+        protagonist_face_list = [face for face, prob in zip(cropped_face_list, probabilities)
+                                 if int(np.argmax(prob)) == self.PROTAGONIST_LABEL]
 
+        if cropped_face_list:
+            print(f" Classified {len(cropped_face_list)} faces at {self.classifier.stats['images_per_sec']:.1f} images/sec")
+            if self.cascade_path is not None:
+                print(f" Cascade pass rates: {self.classifier.stats['pass_rates']}")
         return protagonist_face_list
 
     def get_protagonist_face_json(self, face_list: list):
         """
-        주인공으로 분류된 얼굴 이미지를
-        cropped_faces, cropped_faces_json 폴더로 복사
+        주인공으로 분류된 얼굴 이미지를 cropped_faces 폴더로 복사하고,
+        크롭 정보(face_crops.jsonl)에서 해당 얼굴만 cropped_faces.jsonl 로 모읍니다
         """
         temp_crops_dir = f"results/{self.episode}/temporary_crops"
-        temp_jsons_dir = f"results/{self.episode}/temporary_jsons"
         final_crops_dir = f"results/{self.episode}/cropped_faces"
-        final_json_dir = f"results/{self.episode}/cropped_faces_json"
 
         os.makedirs(final_crops_dir, exist_ok=True)
-        os.makedirs(final_json_dir, exist_ok=True)
+        crop_records = JsonlStore(self.face_crops_path, key="crop")
 
+        protagonist_records = []
         for face in face_list:
-            base_name = os.path.splitext(face)[0]
-
             temp_face_path = f"{temp_crops_dir}/{face}"
-            temp_json_path = f"{temp_jsons_dir}/{base_name}.json"
-
             final_face_path = f"{final_crops_dir}/{face}"
-            final_json_path = f"{final_json_dir}/{base_name}.json"
 
             if os.path.exists(temp_face_path):
                 shutil.copy2(temp_face_path, final_face_path)
-            if os.path.exists(temp_json_path):
-                shutil.copy2(temp_json_path, final_json_path)
-
-
+            if face in crop_records:
+                protagonist_records.append(crop_records.get(face))
 
+        JsonlStore(self.cropped_faces_path, key="crop").rewrite(protagonist_records)
@@ -0,0 +1,154 @@
+"""
+EpisodeDownloader와 FacePlusPlusClient를 로컬 http.server 스텁에 붙여 확인합니다 (네트워크 / API 키 불필요)
+
+    python -m pytest -q tests
+"""
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+from downloader import EpisodeDownloader # noqa: E402
+from facepp import FacePlusPlusClient # noqa: E402
+from manifest import DownloadManifest # noqa: E402
+
+
+class StubServer():
+    """
+    경로별로 정해둔 응답을 순서대로 돌려주는 스텁 서버. 마지막 응답은 계속 반복합니다.
+    응답 = (상태 코드, 본문 bytes, 헤더 dict). hits[경로]에 요청 수를 셉니다.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.hits = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.respond(self)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stub.respond(self)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def respond(self, handler : BaseHTTPRequestHandler) -> None:
+        with self._lock:
+            hit = self.hits.get(handler.path, 0)
+            self.hits[handler.path] = hit + 1
+            responses = self.routes.get(handler.path, [(404, b"", {})])
+            status, body, headers = responses[min(hit, len(responses) - 1)]
+        handler.send_response(status)
+        for key, value in {"Content-Length": str(len(body)), **headers}.items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def parse_image_urls(html : str) -> dict:
+    return {int(idx): url for idx, url in json.loads(html).items()}
+
+
+def test_download_resumes_from_manifest_and_retries_503(stub, tmp_path):
+    stub.routes["/viewer"] = [(200, json.dumps({"1": f"{stub.url}/1.jpg", "2": f"{stub.url}/2.jpg"}).encode(), {})]
+    stub.routes["/1.jpg"] = [(200, b"first", {})]
+    stub.routes["/2.jpg"] = [(503, b"", {"Retry-After": "0"}), (503, b"", {}), (200, b"second image", {})]
+
+    # 1번 이미지는 이전 실행에서 받은 상태
+    episode_direc = tmp_path / "ep1"
+    episode_direc.mkdir()
+    (episode_direc / "1.jpg").write_bytes(b"first")
+    manifest = DownloadManifest(str(episode_direc))
+    manifest.mark_done(1, f"{stub.url}/1.jpg", len(b"first"))
+
+    with EpisodeDownloader(retries=3, backoff=0) as downloader:
+        failed = downloader.download_episodes([("ep1", f"{stub.url}/viewer")], str(tmp_path), parse_image_urls)
+
+    assert failed == set()
+    assert "/1.jpg" not in stub.hits
+    assert stub.hits["/2.jpg"] == 3
+    assert (episode_direc / "2.jpg").read_bytes() == b"second image"
+    assert not (episode_direc / "2.jpg.part").exists()
+
+    manifest = DownloadManifest(str(episode_direc))
+    assert manifest.complete
+    assert manifest.images["2"] == {"url": f"{stub.url}/2.jpg", "bytes": len(b"second image")}
+
+    # 완료된 에피소드는 뷰어 페이지도 다시 요청하지 않습니다
+    with EpisodeDownloader(retries=3, backoff=0) as downloader:
+        downloader.download_episodes([("ep1", f"{stub.url}/viewer")], str(tmp_path), parse_image_urls)
+    assert stub.hits["/viewer"] == 1
+
+
+def test_truncated_download_is_not_renamed(stub, tmp_path):
+    # 본문이 Content-Length보다 짧게 끊기면 .part에 남고 최종 파일로 옮기지 않습니다
+    stub.routes["/1.jpg"] = [(200, b"trunc", {"Content-Length": "100"})]
+
+    with EpisodeDownloader(retries=1, backoff=0) as downloader:
+        with pytest.raises(Exception):
+            downloader.download_file(f"{stub.url}/1.jpg", str(tmp_path / "1.jpg"))
+    assert stub.hits["/1.jpg"] == 2
+    assert not (tmp_path / "1.jpg").exists()
+
+    # 다음 시도가 끝까지 받으면 .part를 최종 이름으로 옮깁니다
+    stub.routes["/1.jpg"] = [(200, b"complete image", {})]
+    with EpisodeDownloader(retries=1, backoff=0) as downloader:
+        assert downloader.download_file(f"{stub.url}/1.jpg", str(tmp_path / "1.jpg")) == len(b"complete image")
+    assert (tmp_path / "1.jpg").read_bytes() == b"complete image"
+    assert not (tmp_path / "1.jpg.part").exists()
+
+
+def test_facepp_retries_concurrency_limit(stub, tmp_path):
+    limit = json.dumps({"error_message": "CONCURRENCY_LIMIT_EXCEEDED"}).encode()
+    label = json.dumps({"faces": [{"face_rectangle": {"top": 1, "left": 2, "width": 3, "height": 4}}]}).encode()
+    stub.routes["/detect"] = [(403, limit, {}), (200, label, {})]
+
+    client = FacePlusPlusClient("key", "secret", cache_direc=str(tmp_path / "cache"), api_url=f"{stub.url}/detect",
+                                qps=1000, backoff=0)
+    with client:
+        assert client.detect(b"panel bytes") == json.loads(label)
+
+    assert stub.hits["/detect"] == 2
+    assert client.stats["retries"] == 1
+
+
+def test_facepp_cache_hit_for_identical_panel(stub, tmp_path):
+    label = json.dumps({"faces": []}).encode()
+    stub.routes["/detect"] = [(200, label, {})]
+
+    panel = np.full((16, 16, 3), 200, dtype=np.uint8)
+    client = FacePlusPlusClient("key", "secret", cache_direc=str(tmp_path / "cache"), api_url=f"{stub.url}/detect",
+                                qps=1000, backoff=0)
+    with client:
+        first = client.submit_array(panel).result()
+        second = client.submit_array(panel.copy()).result()
+
+    assert first == second == {"faces": []}
+    assert stub.hits["/detect"] == 1
+    assert client.stats == {"requests": 1, "cache_hits": 1, "retries": 0}